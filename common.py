@@ -1,8 +1,10 @@
+import multiprocessing
 import os
 import re
 import stat
 import subprocess
 import sys
+import threading
 
 from collections import defaultdict
 from textwrap import dedent
@@ -194,22 +196,47 @@ def is_device(dev):
     mode = os.stat(dev)[stat.ST_MODE]
     return not (not mode & stat.S_IFCHR)
 
-__logged = []
+__logged = set()
+__log_queue = None
 
-def set_logged_list(logged):
-    global __logged
-    __logged = logged
+def set_log_queue(queue):
+    '''Send messages logged by this process to the LogQueue owning @queue,
+    rather than writing them. Used to initialize pool workers.'''
+    global __logged, __log_queue
+    __logged = set()
+    __log_queue = queue
 
 def log_once(id, msg = None, indent = True):
-    global __logged
-
     msg = msg if msg else id
 
-    if id not in  __logged:
-        __logged += [id]
+    if id not in __logged:
+        __logged.add(id)
+        if __log_queue:
+            # Written once by the parent, however many workers send it
+            __log_queue.put((id, msg, indent))
+            return
         if indent:
             msg = '   ' + msg.strip('\t').replace('\n', '\n\t')
         sys.stderr.write('\n' + msg.strip('\n') + '\n')
 
+class LogQueue(object):
+    '''Writes messages sent with log_once by pool workers, each only once.
+    Pass set_log_queue and the queue as the initializer of the pool, then
+    close this after joining the pool.'''
+    def __init__(self):
+        self.queue  = multiprocessing.Queue()
+        self.thread = threading.Thread(target=self.__write)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __write(self):
+        for id, msg, indent in iter(self.queue.get, None):
+            log_once(id, msg, indent)
+
+    def close(self):
+        # Sent after everything workers sent before they exited
+        self.queue.put(None)
+        self.thread.join()
+
 def get_cmd():
     return os.path.split(sys.argv[0])[1]
@@ -1,13 +1,12 @@
 from __future__ import print_function
 import itertools
+import os
 from common import get_executable_hint,ft_freq
 
 '''Paths to binaries.'''
 BINS = {'rtspin'    : get_executable_hint('rtspin', 'liblitmus'),
         'release'   : get_executable_hint('release_ts', 'liblitmus'),
         'ftcat'     : get_executable_hint('ftcat', 'feather-trace-tools'),
-        'ftsplit'   : get_executable_hint('ft2csv', 'feather-trace-tools'),
-        'ftsort'    : get_executable_hint('ftsort', 'feather-trace-tools'),
         'st_trace'  : get_executable_hint('st_trace', 'feather-trace-tools'),
         # Optional, as not everyone uses kernelshark yet
         'trace-cmd' : get_executable_hint('trace-cmd', 'rt-kernelshark', True),
@@ -21,7 +20,10 @@ FILES = {'params_file' : 'params.py',
          'ft_matches'  : r'(ft.*\.bin$)|(.*\.ft)',
          'linux_data'  : 'trace.dat',
          'sched_data'  : 'st-{}.bin',
-         'log_data'    : 'trace.slog'}
+         'log_data'    : 'trace.slog',
+         'decode_cache': 'decoded',
+         'histograms'  : 'histograms',
+         'parse_manifest' : 'manifest.pkl'}
 
 '''Default parameter names in params.py.'''
 PARAMS = {'sched'   : 'scheduler',       # Scheduler used by run_exps
@@ -43,6 +45,7 @@ DEFAULTS = {'duration'    : 10,
             'out-run'     : 'run-data',
             'out-parse'   : 'parse-data',
             'out-plot'    : 'plot-data',
+            'parse-cache' : os.path.expanduser('~/.cache/parse_exps'),
             'cycles'      : ft_freq() or 2000}
 
 
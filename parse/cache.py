@@ -0,0 +1,124 @@
+import config.config as conf
+import hashlib
+import numpy as np
+import os
+import pickle
+
+'''Bytes read at a time while hashing trace files.'''
+HASH_CHUNK = 1 << 20
+
+'''Name of the hashes of an experiment's input files in its work directory.'''
+HASHES_NAME = "input-hashes.pkl"
+
+def file_hash(fname):
+    '''Return a hash of the contents of @fname.'''
+    sha = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), ''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def cache_fname(work_dir, source):
+    return "%s/%s/%s.npz" % (work_dir, conf.FILES['decode_cache'],
+                             os.path.basename(source))
+
+def source_key(source, version):
+    '''Cheap identity of @source, checked before its hash.'''
+    stat = os.stat(source)
+    return np.array([version, stat.st_size, stat.st_mtime])
+
+def load(work_dir, source, version, source_hash=None):
+    '''Return a map of names to arrays decoded from @source and saved in
+    @work_dir, or None if nothing was saved or @source has changed since.
+    A source with a new mtime but the same size and contents, such as a
+    copied file, still uses its saved arrays. Its contents are hashed to
+    check this unless @source_hash, their known hash, is given.'''
+    fname = cache_fname(work_dir, source)
+    key   = source_key(source, version)
+
+    try:
+        with np.load(fname) as saved:
+            arrays = dict((name, saved[name]) for name in saved.files)
+    except Exception:
+        # Missing or unreadable
+        return None
+
+    saved_key  = arrays.pop('source_key')
+    saved_hash = str(arrays.pop('source_hash'))
+
+    if np.array_equal(saved_key, key):
+        return arrays
+    if saved_key[:2].tolist() != key[:2].tolist():
+        # Different version or size
+        return None
+    if saved_hash != (source_hash or file_hash(source)):
+        return None
+
+    # Same contents, remember the new mtime to skip hashing next time
+    save(work_dir, source, arrays, version, saved_hash)
+    return arrays
+
+def make_dirs(path):
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # Created by another process at the same time
+            pass
+
+def save(work_dir, source, arrays, version, source_hash=None):
+    '''Save a map of names to @arrays decoded from @source in @work_dir.'''
+    fname = cache_fname(work_dir, source)
+    make_dirs(os.path.dirname(fname))
+
+    arrays = dict(arrays)
+    arrays['source_key']  = source_key(source, version)
+    arrays['source_hash'] = np.array(source_hash or file_hash(source))
+
+    # Write then rename so a parallel or interrupted parse never reads
+    # a partial file
+    tmp_fname = "%s.%d" % (fname, os.getpid())
+    with open(tmp_fname, 'wb') as f:
+        np.savez(f, **arrays)
+    os.rename(tmp_fname, fname)
+
+def input_hashes(data_dir, work_dir, names):
+    '''Return a map of each of the files @names in @data_dir to a hash of
+    its contents. Hashes are remembered in @work_dir with the size and
+    mtime of each file, so only new or changed files are read.'''
+    fname = "%s/%s/%s" % (work_dir, conf.FILES['decode_cache'], HASHES_NAME)
+    try:
+        with open(fname, 'rb') as f:
+            saved = pickle.load(f)
+    except Exception:
+        saved = {}
+
+    hashes, known = {}, {}
+    for name in names:
+        path = "%s/%s" % (data_dir, name)
+        stat = os.stat(path)
+        key  = (stat.st_size, stat.st_mtime)
+
+        if name in saved and saved[name][0] == key:
+            hashes[name] = saved[name][1]
+        else:
+            hashes[name] = file_hash(path)
+        known[name] = (key, hashes[name])
+
+    if known != saved:
+        make_dirs(os.path.dirname(fname))
+        tmp_fname = "%s.%d" % (fname, os.getpid())
+        with open(tmp_fname, 'wb') as f:
+            pickle.dump(known, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_fname, fname)
+
+    return hashes
+
+def point_key(hashes, settings):
+    '''Return the key of a point parsed from files with @hashes, from
+    input_hashes, using @settings, a tuple of everything else the point
+    depends on.'''
+    sha = hashlib.sha1(repr(settings))
+    for name, source_hash in sorted(hashes.iteritems()):
+        sha.update("%s %s\n" % (name, source_hash))
+    return sha.hexdigest()
@@ -4,6 +4,13 @@ import re
 
 from collections import defaultdict
 
+def write_csv(fname, rows):
+    '''Write @rows, tuples starting with a number, into @fname in order of
+    that number.'''
+    rows = sorted(rows, key=lambda row: float(row[0]))
+    with open(fname, "w") as f:
+        f.write("\n".join(",".join(str(v) for v in row) for row in rows) + "\n")
+
 class DirMapNode(object):
     def __init__(self):
         self.children = defaultdict(DirMapNode)
@@ -64,10 +71,7 @@ class DirMap(object):
             out_path = "/".join(path)
             if node.values:
                 # Leaf
-                with open("/".join(path), "w") as f:
-                    arr = [",".join([str(b) for b in n]) for n in node.values]
-                    arr = sorted(arr, key=lambda x: x[0])
-                    f.write("\n".join(arr) + "\n")
+                write_csv("/".join(path), node.values)
             elif not os.path.isdir(out_path):
                 os.mkdir(out_path)
 
@@ -1,65 +1,314 @@
+import cache
 import config.config as conf
+import histogram
 import numpy as np
 import os
 import re
-import shutil as sh
-import sys
-import subprocess
 
-from point import Measurement,Type
+from collections import defaultdict
+from point import Measurement,CpuStats
 
-FT_SPLIT_NAME  = "overhead={}.bin"
-FT_SORTED_NAME = "sorted-ft.bin"
-FT_ERR_NAME    = "err-ft"
+FT_RUNS_NAME   = "sorted-ft.runs"
 
-def parse_overhead(result, overhead_bin, overhead, cycles, out_dir, err_file):
-    '''Store statistics for @overhead in @overhead_bin into @result.'''
-    ovh_fname = "{}/{}".format(out_dir, FT_SPLIT_NAME).format(overhead)
+# Version of split overheads saved in work directories
+CACHE_VERSION  = 5
+# Name of the array holding the CPU of each sample of an overhead
+CPU_KEY        = "{}-cpus"
 
-    if os.path.exists(ovh_fname):
-        os.remove(ovh_fname)
-    ovh_file = open(ovh_fname, 'w')
+# Methods of filtering overhead outliers and their default arguments
+OUTLIER_FILTERS = {'iqr' : 1.5, 'cycles' : None, 'top' : None}
 
-    # Extract matching overhead events into a seperate file
-    cmd  = [conf.BINS["ftsplit"], "-r", "-b", overhead, overhead_bin]
-    ret  = subprocess.call(cmd, cwd=out_dir, stderr=err_file, stdout=ovh_file)
-    size = os.stat(ovh_fname).st_size
+# Timestamps read or sorted in memory at once when a trace is read in
+# blocks or sorted on disk in runs
+SORT_RECORDS   = 1 << 22
 
-    if ret:
-        raise Exception("Failed (%d) with command: %s" % (ret, " ".join(cmd)))
-    if not size:
-        os.remove(ovh_fname)
-    if size and not ret:
-        # Map and sort file for stats
-        data = np.memmap(ovh_fname, dtype="float32", mode='c')
-        data /= float(cycles) # Scale for processor speed
-        data.sort()
+# Share of physical memory the events of one overhead may take while they
+# are paired in memory. Traces with more are sorted on disk instead
+MEMORY_SHARE   = .25
+# Bytes of memory taken by each event of an overhead while it is paired
+PAIR_BYTES     = 64
 
-        m = Measurement("%s-%s" % (overhead_bin, overhead))
-        m[Type.Max] = data[-1]
-        m[Type.Avg] = np.mean(data)
-        m[Type.Min] = data[0]
-        m[Type.Var] = np.var(data)
+# Layout of a feather-trace timestamp (see include/timestamp.h). The low 48
+# bits of stamp hold the time in cycles, the high 16 the pid. The low 2
+# bits of flags hold the task type, the next the irq flag
+FT_DTYPE = np.dtype([('stamp', '<u8'), ('seq_no', '<u4'), ('cpu', 'u1'),
+                     ('event', 'u1'), ('flags', 'u1'), ('pad', 'V1')])
+TIME_MASK = (1 << 48) - 1
+TASK_RT   = 1
+IRQ_FLAG  = 1 << 2
 
-        result[overhead] = m
+# Map of overheads to the id of their START event. The END event of each
+# overhead is START + 1
+FT_EVENT_IDS = {'LOCK'    : 30,
+                'UNLOCK'  : 40,
+                'SCHED'   : 100,
+                'SCHED2'  : 102,
+                'CXS'     : 104,
+                'RELEASE' : 106,
+                'TICK'    : 110,
+                # A single event which stores its duration as its time
+                'RELEASE_LATENCY' : 208}
+SINGLE_EVENTS = ['RELEASE_LATENCY']
 
-        os.remove(ovh_fname)
+def read_timestamps(fname):
+    '''Map the timestamps in feather-trace file @fname into an array.'''
+    num_stamps = os.path.getsize(fname) / FT_DTYPE.itemsize
+    if not num_stamps:
+        return np.zeros(0, dtype=FT_DTYPE)
+    return np.memmap(fname, dtype=FT_DTYPE, mode='r', shape=(num_stamps,))
 
-def sort_ft(ft_file, err_file, out_dir):
-    '''Create and return file with sorted overheads from @ft_file.'''
-    out_fname = "{}/{}".format(out_dir, FT_SORTED_NAME)
+def sort_key(stamps):
+    '''Return keys ordering @stamps by CPU, then sequence number.'''
+    return (stamps['cpu'].astype(np.uint64) << 32) | stamps['seq_no']
 
-    # Sort happens in-place
-    sh.copyfile(ft_file, out_fname)
-    cmd = [conf.BINS['ftsort'], out_fname]
+def sort_stamps(stamps):
+    return stamps[np.argsort(sort_key(stamps), kind='mergesort')]
 
-    ret = subprocess.call(cmd, cwd=out_dir, stderr=err_file, stdout=err_file)
-    if ret:
-        raise Exception("Sort failed (%d) with command: %s" % (ret, " ".join(cmd)))
+def merge_runs(runs, block):
+    '''Generate the timestamps in sorted arrays @runs in order, as sorted
+    arrays, holding at most @block timestamps of each run in memory.'''
+    heads = [np.zeros(0, dtype=FT_DTYPE)] * len(runs)
+    pos   = [0] * len(runs)
 
-    return out_fname
+    while True:
+        for i, run in enumerate(runs):
+            if not len(heads[i]) and pos[i] < len(run):
+                heads[i] = np.array(run[pos[i]:pos[i] + block])
+                pos[i] += block
 
-def extract_ft_data(result, data_dir, work_dir, cycles):
+        if not any(len(head) for head in heads):
+            break
+
+        # No timestamp left in a run can come before the last one read
+        # from it, so everything up to the smallest of those is in order
+        unread = [sort_key(head[-1:])[0] for i, head in enumerate(heads)
+                  if pos[i] < len(runs[i])]
+        bound  = min(unread) if unread else None
+
+        merged = []
+        for i, head in enumerate(heads):
+            if bound is None:
+                done = len(head)
+            else:
+                done = np.searchsorted(sort_key(head), bound, 'right')
+            merged += [head[:done]]
+            heads[i] = head[done:]
+
+        yield sort_stamps(np.concatenate(merged))
+
+def sort_ft(ft_file, work_dir, run_size=SORT_RECORDS):
+    '''Generate the timestamps in @ft_file sorted by CPU and sequence
+    number, as sorted arrays. @ft_file is not copied or modified. Traces of
+    more than @run_size timestamps are sorted in runs, which are saved in
+    @work_dir and merged as the arrays are read.'''
+    stamps = read_timestamps(ft_file)
+
+    if len(stamps) <= run_size:
+        yield sort_stamps(stamps)
+        return
+
+    runs_fname = "%s/%s" % (work_dir, FT_RUNS_NAME)
+    try:
+        with open(runs_fname, 'wb') as f:
+            for start in range(0, len(stamps), run_size):
+                sort_stamps(stamps[start:start + run_size]).tofile(f)
+
+        runs = read_timestamps(runs_fname)
+        runs = [runs[s:s + run_size] for s in range(0, len(runs), run_size)]
+
+        for block in merge_runs(runs, max(run_size / len(runs), 1)):
+            yield block
+    finally:
+        if os.path.exists(runs_fname):
+            os.remove(runs_fname)
+
+def find_holes(stamps):
+    '''Return the sequence numbers missing from @stamps, in order, i.e. of
+    records which were lost. The number of these before a timestamp's
+    sequence number is the count of holes before it in the whole trace.
+    Only a map of the sequence numbers seen is kept in memory, not the
+    numbers themselves.'''
+    if not len(stamps):
+        return np.zeros(0, dtype=np.int64)
+
+    seq  = stamps['seq_no']
+    low  = int(seq.min())
+    seen = np.zeros(int(seq.max()) - low + 1, dtype=np.bool_)
+    for start in xrange(0, len(stamps), SORT_RECORDS):
+        seen[seq[start:start + SORT_RECORDS] - low] = True
+    return np.flatnonzero(~seen) + low
+
+def memory_budget():
+    '''Return the bytes of memory which pairing may take.'''
+    return int(MEMORY_SHARE * os.sysconf('SC_PAGE_SIZE') *
+               os.sysconf('SC_PHYS_PAGES'))
+
+def fits_in_memory(stamps, budget):
+    '''Return whether the events of each overhead in @stamps can be paired
+    in memory, taking at most @budget bytes. Events are counted one block
+    at a time.'''
+    counts = np.zeros(256, dtype=np.int64)
+    for start in xrange(0, len(stamps), SORT_RECORDS):
+        block = stamps['event'][start:start + SORT_RECORDS]
+        counts += np.bincount(block, minlength=len(counts))
+
+    for overhead in conf.OVH_BASE_EVENTS:
+        event_id = FT_EVENT_IDS[overhead]
+        events = counts[event_id]
+        if overhead not in SINGLE_EVENTS:
+            events += counts[event_id + 1]
+        if events * PAIR_BYTES > budget:
+            return False
+    return True
+
+def pair_events(found, start_id, holes):
+    '''Return the durations, in cycles, and CPUs of each pair of START and
+    END events for the overhead starting with @start_id in @found, which
+    holds only events of that overhead sorted by CPU and sequence number.
+    Pairs with any of the @holes from find_holes between them are skipped.'''
+    first, second = found[:-1], found[1:]
+    times = (found['stamp'] & TIME_MASK).astype(np.int64)
+    durations = times[1:] - times[:-1]
+
+    # A START must be directly followed by its END on the same CPU,
+    # otherwise a record was lost
+    pairs  = (first['event'] == start_id) & (second['event'] == start_id + 1)
+    pairs &= first['cpu'] == second['cpu']
+    # Only consider overheads of real-time tasks
+    pairs &= (first['flags'] & 3 == TASK_RT) & (second['flags'] & 3 == TASK_RT)
+    # Skip overheads which were interrupted
+    pairs &= (second['flags'] & IRQ_FLAG) == 0
+    # Skip pairs with time going backwards between CPUs
+    pairs &= durations >= 0
+    # As ft2csv does, skip pairs which records may have been lost between
+    pairs &= (np.searchsorted(holes, first['seq_no']) ==
+              np.searchsorted(holes, second['seq_no']))
+
+    return durations[pairs].astype(np.float32), first['cpu'][pairs]
+
+def split_overheads(blocks, holes, is_sorted=False):
+    '''Return a map of overheads to arrays of their samples, in cycles, from
+    @blocks, arrays of feather-trace timestamps with @holes from find_holes,
+    and of CPU_KEY of each overhead to the CPUs the samples were taken on.
+    If @is_sorted, @blocks are in order by CPU and sequence number, as from
+    sort_ft. Otherwise @blocks must be a single array, and the events of
+    each overhead in it are sorted in memory.'''
+    samples = defaultdict(list)
+    # Last event of each overhead in the previous block, which may be
+    # the START of a pair ending in the next
+    last    = {}
+
+    for block in blocks:
+        events = block['event']
+
+        for overhead in conf.OVH_BASE_EVENTS:
+            event_id = FT_EVENT_IDS[overhead]
+
+            if overhead in SINGLE_EVENTS:
+                found = block[events == event_id]
+                if not is_sorted:
+                    # In the same order as from sort_ft
+                    found = found[np.lexsort((found['seq_no'], found['cpu']))]
+                times = (found['stamp'] & TIME_MASK).astype(np.float32)
+                samples[overhead] += [times]
+                samples[CPU_KEY.format(overhead)] += [found['cpu']]
+                continue
+
+            found = block[(events == event_id) | (events == event_id + 1)]
+            if not is_sorted:
+                found = found[np.lexsort((found['seq_no'], found['cpu']))]
+            if overhead in last:
+                found = np.concatenate((last[overhead], found))
+            if len(found):
+                last[overhead] = found[-1:]
+
+            durations, cpus = pair_events(found, event_id, holes)
+            samples[overhead] += [durations]
+            samples[CPU_KEY.format(overhead)] += [cpus]
+
+    return dict((name, np.concatenate(data))
+                for name, data in samples.iteritems())
+
+def find_outliers(data, method, arg):
+    '''Return a mask of the samples in @data which are not outliers. The
+    'iqr' @method keeps samples within @arg interquartile ranges of the
+    quartiles, 'cycles' keeps samples of at most @arg cycles and 'top'
+    discards the @arg largest samples.'''
+    if method == 'iqr':
+        low, high = np.percentile(data, [25, 75])
+        spread = arg * (high - low)
+        return (data >= low - spread) & (data <= high + spread)
+    elif method == 'cycles':
+        return data <= arg
+    elif method == 'top':
+        keep  = np.ones(len(data), dtype=np.bool_)
+        first = len(data) - min(int(arg), len(data))
+        if first < len(data):
+            keep[np.argpartition(data, first)[first:]] = False
+        return keep
+    else:
+        raise ValueError("Unknown outlier filter '%s'" % method)
+
+def parse_overhead(result, overhead_bin, overhead, data, cpus, cycles,
+                   outliers=None, hist=None):
+    '''Store statistics for @overhead samples in @data, overall and on each
+    of the @cpus they were taken on, into @result. If @outliers is a
+    (method, arg) tuple, samples found by find_outliers are left out and
+    counted in an @overhead-outliers measurement. If @hist is a (kind, arg)
+    tuple, a histogram of the samples is stored too.'''
+    if not len(data):
+        return
+
+    name = "%s-%s" % (overhead_bin, overhead)
+
+    if outliers:
+        keep = find_outliers(data, *outliers)
+
+        discarded = [len(data) - np.count_nonzero(keep)]
+        result["%s-outliers" % overhead] = \
+            Measurement("%s-outliers" % name).from_array(discarded, sketch=False)
+
+        # The only copy of the samples made
+        data, cpus = data[keep], cpus[keep]
+        if not len(data):
+            return
+    else:
+        data = data.copy()
+
+    data /= float(cycles) # Scale for processor speed
+
+    if hist:
+        result.histograms[overhead] = histogram.from_values(data, *hist)
+
+    # Too many samples to sketch one at a time
+    result[overhead] = Measurement(name).from_array(data, sketch=False,
+                                                    percentiles=True)
+
+    # Group samples by CPU, keeping their order within each
+    order = np.argsort(cpus, kind='mergesort')
+    ids, starts = np.unique(cpus[order], return_index=True)
+    groups = np.split(data[order], starts[1:])
+
+    measures = [Measurement(name).from_array(g, sketch=False,
+                                             percentiles=True)
+                for g in groups]
+    result.cpu_stats[overhead] = CpuStats(name, ids, measures)
+
+def save_histograms(result, work_dir):
+    '''Save each histogram in @result in @work_dir.'''
+    hist_dir = "%s/%s" % (work_dir, conf.FILES['histograms'])
+    if result.histograms and not os.path.exists(hist_dir):
+        os.mkdir(hist_dir)
+
+    for overhead, hist in result.histograms.iteritems():
+        np.save("%s/%s.npy" % (hist_dir, overhead), hist)
+
+def extract_ft_data(result, data_dir, work_dir, cycles, sort=True,
+                    outliers=None, hist=None, hashes=None):
+    '''Store overhead statistics from the feather-trace file in @data_dir
+    into @result. @hashes, if given, maps the names of files in @data_dir
+    to hashes of their contents from cache.input_hashes, so the file is
+    not hashed again to check its saved samples.'''
     data_dir = os.path.abspath(data_dir)
     work_dir = os.path.abspath(work_dir)
 
@@ -73,13 +322,26 @@ def extract_ft_data(result, data_dir, work_dir, cycles):
     if not os.path.getsize(bin_file):
         return False
 
-    with open("%s/%s" % (work_dir, FT_ERR_NAME), 'w') as err_file:
-        sorted_bin = sort_ft(bin_file, err_file, work_dir)
+    source_hash = (hashes or {}).get(bins[0])
+
+    # Overheads split from this file by an earlier parse are reused
+    samples = cache.load(work_dir, bin_file, CACHE_VERSION, source_hash)
+
+    if samples is None:
+        stamps = read_timestamps(bin_file)
+        holes  = find_holes(stamps)
+        if sort and not fits_in_memory(stamps, memory_budget()):
+            # Too large to pair in memory, so pair it as it is sorted
+            samples = split_overheads(sort_ft(bin_file, work_dir), holes, True)
+        else:
+            samples = split_overheads([stamps], holes)
+        cache.save(work_dir, bin_file, samples, CACHE_VERSION, source_hash)
 
-        for event in conf.OVH_BASE_EVENTS:
-            parse_overhead(result, sorted_bin, event, cycles,
-                           work_dir, err_file)
+    for event in conf.OVH_BASE_EVENTS:
+        parse_overhead(result, bin_file, event, samples.get(event, []),
+                       samples.get(CPU_KEY.format(event), []), cycles,
+                       outliers, hist)
 
-        os.remove(sorted_bin)
+    save_histograms(result, work_dir)
 
     return True
@@ -0,0 +1,53 @@
+'''
+Histograms stored as arrays with a (low, high, count) row for each
+non-empty bin. Bin edges depend only on the kind of histogram, never on
+the values counted, so histograms of the same kind merge by adding the
+counts of equal bins.
+'''
+import numpy as np
+
+# Kinds of histograms and the default argument of each: the width of
+# 'linear' bins and the number of 'log' bins in each power of ten
+KINDS = {'linear' : .1, 'log' : 20}
+
+def from_values(values, kind, arg):
+    '''Return a histogram of @kind counting @values.'''
+    values = np.asarray(values, dtype=np.float64)
+    zeros  = None
+
+    if kind == 'linear':
+        bins = np.floor(values / arg)
+        low, high = (lambda b: b * arg), (lambda b: (b + 1) * arg)
+    elif kind == 'log':
+        # Zero has no logarithm, so it is counted in a bin of its own
+        zeros  = np.count_nonzero(values <= 0)
+        values = values[values > 0]
+        bins = np.floor(np.log10(values) * arg)
+        low, high = (lambda b: 10 ** (b / arg)), (lambda b: 10 ** ((b + 1) / arg))
+    else:
+        raise ValueError("Unknown histogram kind '%s'" % kind)
+
+    bins, counts = np.unique(bins, return_counts=True)
+    hist = np.column_stack((low(bins), high(bins), counts))
+
+    if zeros:
+        hist = np.vstack(([[0, 0, zeros]], hist))
+    return hist
+
+def merge(hists):
+    '''Return a histogram of all values counted in @hists.'''
+    rows = np.concatenate(hists)
+    rows = rows[np.lexsort((rows[:,1], rows[:,0]))]
+
+    first = np.ones(len(rows), dtype=np.bool_)
+    first[1:] = (rows[1:,0] != rows[:-1,0]) | (rows[1:,1] != rows[:-1,1])
+    starts = np.flatnonzero(first)
+
+    counts = np.add.reduceat(rows[:,2], starts)
+    return np.column_stack((rows[starts,0], rows[starts,1], counts))
+
+def cdf(hist):
+    '''Return the upper edge of each bin in @hist and the fraction of values
+    counted in it or below.'''
+    counts = np.cumsum(hist[:,2])
+    return hist[:,1], counts / counts[-1]
@@ -3,18 +3,94 @@ Too much duplicate code in this file
 '''
 
 import copy
+import histogram
+import math
 import numpy as np
+import warnings
 from enum import Enum
 from collections import defaultdict
+from sketch import QuantileSketch
+
+TYPES = ['Min','Max','Avg','Var','P50','P90','P95','P99','P999',
+         'CILow','CIHigh']
+Type  = Enum(TYPES)
+# Position of each type in the values of a measurement
+TYPE_INDEX = dict((type, i) for i, type in enumerate(TYPES))
+
+# Percentile types and the quantile each holds. These are summarized by
+# merging quantile sketches rather than through a typemap
+PERCENTILES = {Type.P50 : .5, Type.P90 : .9, Type.P95 : .95,
+               Type.P99 : .99, Type.P999 : .999}
 
-Type = Enum(['Min','Max','Avg','Var'])
 default_typemap = {Type.Max : {Type.Max : 1, Type.Min : 0, Type.Avg : 0, Type.Var : 0},
                    Type.Min : {Type.Max : 0, Type.Min : 1, Type.Avg : 0, Type.Var : 0},
-                   Type.Avg : {Type.Max : 1, Type.Min : 1, Type.Avg : 1, Type.Var : 1}}
+                   Type.Avg : {Type.Max : 1, Type.Min : 1, Type.Avg : 1, Type.Var : 1},
+                   # Bounds of confidence intervals of the average, if
+                   # summaries are bootstrapped
+                   Type.CILow  : {Type.Max : 1, Type.Min : 0, Type.Avg : 1, Type.Var : 0},
+                   Type.CIHigh : {Type.Max : 1, Type.Min : 0, Type.Avg : 1, Type.Var : 0}}
+for row in default_typemap.itervalues():
+    row.update((p_type, 0) for p_type in PERCENTILES)
+
+# Order of the types stored for each CPU by CpuStats
+CPU_TYPES = [Type.Min, Type.Max, Type.Avg, Type.Var] + sorted(PERCENTILES)
+CPU_INDEX = [TYPE_INDEX[t] for t in CPU_TYPES]
+
+# Values reduced at a time by array_stats, few enough to stay in cache
+STATS_BLOCK = 1 << 16
+
+# Confidence of the intervals of bootstrapped summaries
+CONFIDENCE = .95
+# Bytes of resampled means held in memory at once while bootstrapping
+BOOTSTRAP_BYTES = 1 << 26
 
 def make_typemap():
     return copy.deepcopy(default_typemap)
 
+def array_stats(array):
+    '''Return the min, max, mean and variance of @array. Each block of
+    @array is fully reduced while in cache, so @array is only read once.'''
+    low, high = np.inf, -np.inf
+    num, mean, m2 = 0, 0.0, 0.0
+
+    for start in xrange(0, len(array), STATS_BLOCK):
+        block = np.asarray(array[start:start + STATS_BLOCK], dtype=np.float64)
+        low  = min(low,  block.min())
+        high = max(high, block.max())
+
+        # Combine the mean and squared deviations of this block with
+        # those of earlier blocks (Chan et al.)
+        b_num  = len(block)
+        b_mean = block.mean()
+        b_dev  = block - b_mean
+        b_m2   = np.dot(b_dev, b_dev)
+
+        delta = b_mean - mean
+        total = num + b_num
+        mean += delta * b_num / total
+        m2   += b_m2 + delta * delta * num * b_num / total
+        num   = total
+
+    return float(low), float(high), mean, m2 / num
+
+def array_percentiles(array):
+    '''Return a map of percentile types to their values in @array,
+    interpolated as by np.percentile. Only the values around each
+    percentile are put in place, rather than sorting all of @array.'''
+    ranks = dict((p_type, q * (len(array) - 1))
+                 for p_type, q in PERCENTILES.iteritems())
+    kth   = set()
+    for rank in ranks.itervalues():
+        kth |= set([int(math.floor(rank)), int(math.ceil(rank))])
+    selected = np.partition(array, sorted(kth))
+
+    values = {}
+    for p_type, rank in ranks.iteritems():
+        low  = float(selected[int(math.floor(rank))])
+        high = float(selected[int(math.ceil(rank))])
+        values[p_type] = low + (high - low) * (rank - math.floor(rank))
+    return values
+
 def dict_str(adict, sep = "\n"):
     def num_str(v):
         try:
@@ -25,129 +101,618 @@ def dict_str(adict, sep = "\n"):
     size = 20 if sep == "\n" else 4
     return sep.join([("%" + str(size) + "s: %9s") % (k, num_str(v)) for (k,v) in sorted(adict.iteritems())])
 
+class Store(object):
+    '''Fixed-layout storage for many measurements. Each measurement is a
+    row of values indexed by TYPE_INDEX, NaN where a type was not measured,
+    with @shape rows of these for each measurement. The id, number of
+    values and sketch of each measurement are kept beside the values.'''
+    __slots__ = ['values', 'nums', 'ids', 'sketches', 'size']
+
+    def __init__(self, shape=(), capacity=1):
+        self.values   = np.full((capacity,) + shape + (len(TYPES),), np.nan)
+        self.nums     = np.zeros(capacity, dtype=np.int64)
+        self.ids      = [None] * capacity
+        self.sketches = {}
+        self.size     = 0
+
+    def add(self, id):
+        '''Return the row of a new, empty measurement.'''
+        if self.size == len(self.values):
+            grow = len(self.values)
+            self.values = np.concatenate((self.values,
+                                          np.full_like(self.values, np.nan)))
+            self.nums = np.concatenate((self.nums, np.zeros_like(self.nums)))
+            self.ids += [None] * grow
+
+        self.ids[self.size] = id
+        self.size += 1
+        return self.size - 1
+
+    def __getstate__(self):
+        # Unused capacity is not pickled
+        return (self.values[:self.size], self.nums[:self.size],
+                self.ids[:self.size], self.sketches, self.size)
+
+    def __setstate__(self, state):
+        self.values, self.nums, self.ids, self.sketches, self.size = state
+
 class Measurement(object):
-    def __init__(self, id = None, kv = {}, default=list):
-        self.id = id
-        self.stats = defaultdict(default)
+    '''A map of Types to values, viewing a measurement in a Store. A new
+    measurement is given a Store of its own.'''
+    __slots__ = ['store', 'index']
+    SHAPE = ()
+
+    def __init__(self, id = None, kv = {}, store = None, index = None):
+        if store is None:
+            store = Store(self.SHAPE)
+            index = (store.add(id),)
+        self.store = store
+        # Row of the measurement in store, followed by any index into it
+        self.index = index
         for k, v in kv.iteritems():
             self[k] = v
 
-    def from_array(self,array):
-        array = np.array(array)
-        self[Type.Max] = array.max()
-        self[Type.Avg] = array.mean()
-        self[Type.Var] = array.var()
-        self[Type.Min] = array.min()
+    def __get_id(self):
+        return self.store.ids[self.index[0]]
+    def __set_id(self, id):
+        self.store.ids[self.index[0]] = id
+    id = property(__get_id, __set_id)
+
+    def __get_num(self):
+        '''Number of values measured, 0 if unknown.'''
+        return int(self.store.nums[self.index[0]])
+    def __set_num(self, num):
+        self.store.nums[self.index[0]] = num
+    num = property(__get_num, __set_num)
+
+    def __get_sketch(self):
+        '''Sketch of the values measured, if they were kept.'''
+        return self.store.sketches.get(self.index[0])
+    def __set_sketch(self, sketch):
+        self.store.sketches[self.index[0]] = sketch
+    sketch = property(__get_sketch, __set_sketch)
+
+    @property
+    def values(self):
+        return self.store.values[self.index]
+
+    def from_array(self, array, sketch = True, percentiles = False):
+        '''Measure the values in @array, keeping a sketch of them for
+        summaries if @sketch is set. Percentiles are only measured if
+        @percentiles is set, as they mean little for a few values.'''
+        array = np.asarray(array)
+        low, high, mean, var = array_stats(array)
+        self[Type.Max] = high
+        self[Type.Avg] = mean
+        self[Type.Var] = var
+        self[Type.Min] = low
+        if percentiles:
+            for p_type, value in array_percentiles(array).iteritems():
+                self[p_type] = value
+        if sketch:
+            self.sketch = QuantileSketch.from_values(array)
+        self.num = len(array)
         return self
 
-    def __check_type(self, type):
+    def from_sketch(self, sketch, scale = 1):
+        '''Measure the values in @sketch, multiplied by @scale.'''
+        if scale != 1:
+            sketch = sketch.scaled(scale)
+        self[Type.Max] = sketch.max
+        self[Type.Avg] = sketch.mean()
+        self[Type.Var] = sketch.var()
+        self[Type.Min] = sketch.min
+        for p_type, q in PERCENTILES.iteritems():
+            self[p_type] = sketch.quantile(q)
+        self.sketch = sketch
+        self.num = sketch.num
+        return self
+
+    def _type_index(self, type):
         if not type in Type:
             raise AttributeError("Not a valid type '%s'" % type)
+        return TYPE_INDEX[type]
 
     def __getitem__(self, type):
-        self.__check_type(type)
-        return self.stats[type]
+        value = self.store.values[self.index + (self._type_index(type),)]
+        if value != value:
+            # NaN, never measured
+            raise KeyError(type)
+        return value
 
     def __iter__(self):
-        return self.stats.iteritems()
+        values = self.values
+        for type in TYPES:
+            value = values[TYPE_INDEX[type]]
+            if value == value:
+                yield type, value
 
     def __contains__(self, type):
-        self.__check_type(type)
-        return type in self.stats
+        value = self.store.values[self.index + (self._type_index(type),)]
+        return value == value
 
-    def __setitem__(self, t, value):
-        self.__check_type(t)
-        # Numpy returns single memmapped values which can't be pickled
-        # Convert them to floats which can be
-        if type(value) is np.memmap:
-            value = float(value)
-        self.stats[t] = value
+    def __setitem__(self, type, value):
+        self.store.values[self.index + (self._type_index(type),)] = value
 
     def __str__(self):
-        return "%s" % dict_str(self.stats, " ")
+        return "%s" % dict_str(dict(self), " ")
+
+    def __getstate__(self):
+        return (self.store, self.index)
+
+    def __setstate__(self, state):
+        self.store, self.index = state
+
+def required_types(typemap):
+    '''Return the base types every measurement summarized by @typemap must
+    have.'''
+    required = []
+    for base_type in Type:
+        matches = [t.get(base_type, 0) for t in typemap.itervalues()]
+        if bool(sum(matches)):
+            required += [base_type]
+    return required
+
+def sum_trials(values):
+    '''Return the sum of @values over its trial axis (1), adding trials
+    in order as a Python sum would. np.add.reduce may add them pairwise,
+    depending on the shape of @values.'''
+    total = np.zeros(values.shape[:1] + values.shape[2:])
+    for trial in xrange(values.shape[1]):
+        total += values[:, trial]
+    return total
+
+def summarize(names, values, nums, present, sketches, typemap=default_typemap,
+              bootstrap=None):
+    '''Summarize many groups of measurements of many statistics at once.
+    @values holds the values of each measurement indexed by group, trial,
+    statistic (named in @names) and TYPE_INDEX, @nums their numbers of values
+    and @present whether each was measured at all. @sketches maps (group,
+    trial, statistic) to the sketch of a measurement. If @bootstrap is a
+    (resamples, seed) tuple, confidence intervals are bootstrapped too.
+
+    Return the values of each Summary indexed by group, statistic, summary
+    type and base type, their numbers of values and a map of (group,
+    statistic) to the sketches merged for them. Trials are reduced in order,
+    giving the same numbers as summarizing each group one value at a time.'''
+    groups, trials, stats = present.shape
+    count  = present.sum(axis=1)
+    result = np.full((groups, stats, len(TYPES), len(TYPES)), np.nan)
+
+    required = [TYPE_INDEX[t] for t in required_types(typemap)]
+    missing  = present[..., None] & np.isnan(values[..., required])
+    if missing.any():
+        _, _, stat, type = np.argwhere(missing)[0]
+        raise ValueError("measurement '%s' missing type '%s'" %
+                         (names[stat], TYPES[required[type]]))
+
+    # Trials which were not measured add nothing to sums
+    filled = np.where(present[..., None], values, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        reduced = {Type.Min : np.fmin.reduce(values, axis=1),
+                   Type.Max : np.fmax.reduce(values, axis=1),
+                   Type.Avg : sum_trials(filled) / count[..., None]}
+
+    for sum_type, sum_values in reduced.iteritems():
+        bases = [TYPE_INDEX[t] for t in Type if typemap[sum_type].get(t)]
+        result[:, :, TYPE_INDEX[sum_type], bases] = sum_values[..., bases]
+
+    num = pool_moments(values, nums, present, count, result, typemap)
+    merged = merge_sketches(sketches, present, count)
+    summarize_percentiles(values, filled, present, count, merged, result)
+    if bootstrap:
+        bootstrap_intervals(filled, nums, present, count, result, typemap,
+                            *bootstrap)
+
+    return result, num, merged
+
+def find_pooled(nums, present, count):
+    '''Return whether the number of values in every measurement of each
+    group of statistics is known, so their values can be pooled.'''
+    return ((nums > 0) | ~present).all(axis=1) & (count > 0)
+
+def pool_moments(values, nums, present, count, result, typemap):
+    '''Replace the average mean and variance in @result with the mean and
+    variance of all values in each group, where the number of values in
+    every measurement of the group is known. Return the number of values
+    in each summary, 0 where unknown.'''
+    pooled = find_pooled(nums, present, count)
+    avg = np.where(present, values[..., TYPE_INDEX[Type.Avg]], 0.0)
+    var = np.where(present, values[..., TYPE_INDEX[Type.Var]], 0.0)
+    counts = np.where(present, nums, 0)
+
+    # Merge the moments of each trial in turn (Chan et al.), adding
+    # exactly nothing for trials which were not measured
+    num  = np.zeros(count.shape, dtype=np.int64)
+    mean = np.zeros(count.shape)
+    m2   = np.zeros(count.shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for trial in xrange(present.shape[1]):
+            c = counts[:, trial]
+            delta = avg[:, trial] - mean
+            total = num + c
+            safe  = np.maximum(total, 1)
+            mean  = mean + delta * c / safe
+            m2    = m2 + (var[:, trial] * c + delta * delta * num * c / safe)
+            num   = total
+        var = m2 / num
+
+    avg_index = TYPE_INDEX[Type.Avg]
+    for base_type, pooled_values in (Type.Avg, mean), (Type.Var, var):
+        if typemap[Type.Avg].get(base_type):
+            index = (Ellipsis, avg_index, TYPE_INDEX[base_type])
+            result[index] = np.where(pooled, pooled_values, result[index])
+
+    return np.where(pooled, num, 0)
+
+def merge_sketches(sketches, present, count):
+    '''Return a map of (group, statistic) to a sketch of all values in the
+    group, for groups with a sketch of every measurement.'''
+    sketched = np.zeros(present.shape, dtype=np.bool_)
+    for index in sketches:
+        sketched[index] = True
+
+    merged = {}
+    complete = (sketched | ~present).all(axis=1) & (count > 0)
+    for group, stat in zip(*np.nonzero(complete)):
+        trials = np.flatnonzero(present[group, :, stat])
+        first  = sketches[(group, trials[0], stat)]
+        merged[(group, stat)] = QuantileSketch(first.accuracy)
+        for trial in trials:
+            merged[(group, stat)].merge(sketches[(group, trial, stat)])
+    return merged
+
+def summarize_percentiles(values, filled, present, count, merged, result):
+    '''Summarize percentiles in @result, where every measurement of a group
+    has them, by pooling the values of the group if it has a sketch in
+    @merged. Without a sketch of those values, percentiles are averaged.'''
+    min_index, max_index, avg_index = (TYPE_INDEX[t] for t in
+                                       (Type.Min, Type.Max, Type.Avg))
+    for p_type, q in PERCENTILES.iteritems():
+        p = TYPE_INDEX[p_type]
+        measured = (~np.isnan(values[..., p]) | ~present).all(axis=1)
+        measured &= count > 0
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            low  = np.fmin.reduce(values[..., p], axis=1)
+            high = np.fmax.reduce(values[..., p], axis=1)
+            avg  = sum_trials(filled[..., p]) / count
+
+        for (group, stat), sketch in merged.iteritems():
+            # The percentile of all values
+            avg[group, stat] = sketch.quantile(q)
+
+        for index, reduced in ((min_index, low), (max_index, high),
+                               (avg_index, avg)):
+            result[:, :, index, p] = np.where(measured, reduced, np.nan)
+
+def bootstrap_intervals(filled, nums, present, count, result, typemap,
+                        resamples, seed):
+    '''Store the bounds of CONFIDENCE intervals of the average of each type
+    summarized by the CILow and CIHigh rows of @typemap into @result. These
+    are percentiles of the averages of @resamples resamples of the trials
+    of each group. Resamples are drawn from a RandomState seeded with
+    @seed and depend only on the number of trials in a group, so the
+    intervals of a group do not depend on the others. Where pool_moments
+    pools the mean, trials count by their @nums in the average of Avg.'''
+    groups, trials, stats = present.shape
+    bases = [TYPE_INDEX[t] for t in Type if typemap[Type.CILow].get(t) or
+             typemap[Type.CIHigh].get(t)]
+    if not bases or not trials:
+        return
+
+    # Weight of each trial in the average of each base type
+    scale = np.repeat(present[..., None], len(bases), axis=-1)
+    scale = scale.astype(np.float64)
+    if TYPE_INDEX[Type.Avg] in bases:
+        pooled = find_pooled(nums, present, count)[:, None]
+        scale[..., bases.index(TYPE_INDEX[Type.Avg])] = \
+            np.where(pooled, np.where(present, nums, 0), present)
+
+    # Groups end with their last measured trial
+    measured = present.any(axis=2)
+    last = trials - np.argmax(measured[:, ::-1], axis=1)
+    last[~measured.any(axis=1)] = 0
+
+    tail    = 50 * (1 - CONFIDENCE)
+    bounds  = np.full((2, groups, stats, len(bases)), np.nan)
+    block   = max(BOOTSTRAP_BYTES // (resamples * stats * len(bases) * 8), 1)
+
+    for num in np.unique(last[last > 0]):
+        # Times each trial is drawn into each resample
+        uniform = np.random.RandomState(seed).random_sample((resamples, num))
+        draws = (uniform * num).astype(np.intp)
+        draws += num * np.arange(resamples)[:, None]
+        weights = np.bincount(draws.ravel(), minlength=resamples * num)
+        weights = weights.reshape(resamples, num).astype(np.float64)
+
+        members = np.flatnonzero(last == num)
+        for start in xrange(0, len(members), block):
+            group = members[start:start + block]
+            shape = (resamples, len(group), stats)
+
+            # Weighted sums of values and of the weights of the trials
+            # measured in each resample, as products of the weights and
+            # the trials
+            taken = scale[group, :num].swapaxes(0, 1)
+            sums  = filled[group, :num][..., bases].swapaxes(0, 1) * taken
+            sums  = np.dot(weights, sums.reshape(num, -1))
+            taken = np.dot(weights, taken.reshape(num, -1))
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = (sums.reshape(shape + (-1,)) /
+                         taken.reshape(shape + (-1,)))
+
+            if np.isnan(means).any():
+                # A resample may draw no trial measuring a statistic
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    interval = np.nanpercentile(means, [tail, 100 - tail],
+                                                axis=0)
+            else:
+                interval = np.percentile(means, [tail, 100 - tail], axis=0)
+            bounds[:, group] = interval
+
+    bounds[:, count == 0] = np.nan
+    for bound, sum_type in enumerate((Type.CILow, Type.CIHigh)):
+        for i, base in enumerate(bases):
+            if typemap[sum_type].get(TYPES[base]):
+                result[:, :, TYPE_INDEX[sum_type], base] = bounds[bound, ..., i]
 
 class Summary(Measurement):
-    def __init__(self, id="", measures=[], typemap = default_typemap):
-        super(Summary, self).__init__(id, default=Measurement)
+    '''A map of Types to Measurements summarizing several measurements.'''
+    __slots__ = []
+    SHAPE = (len(TYPES),)
+
+    def __init__(self, id="", measures=[], typemap = default_typemap,
+                 store = None, index = None, bootstrap = None):
+        super(Summary, self).__init__(id, store=store, index=index)
 
         if measures:
-            self.__check_types(measures, typemap)
-            self.__summarize(measures, typemap)
-
-    def __check_types(self, measures, typemap):
-        required_types = self.__get_required(typemap)
-        for m in measures:
-            for type in required_types:
-                if type not in m:
-                    raise ValueError("measurement '%s' missing type '%s'" %
-                                     (self.id, type))
-
-    def __summarize(self, measures, typemap):
-        for sum_type in Type:
-            self[sum_type] = Measurement(self.id)
-
-        def avg(vals):
-            return sum(vals) / len(vals)
-
-        for base_type in Type:
-            for sum_type, func in (Type.Min,min),(Type.Max,max),(Type.Avg, avg):
-                if typemap[sum_type][base_type]:
-                    val = func([m[base_type] for m in measures])
-                    self[sum_type][base_type] = val
-
-    def __get_required(self, typemap):
-        required = []
-        for base_type in Type:
-            matches = [t[base_type] for t in typemap.itervalues()]
-            if bool(sum(matches)):
-                required += [base_type]
-        return required
+            values = np.array([m.values for m in measures])
+            nums   = np.array([m.num for m in measures])
+            sketches = dict(((0, trial, 0), m.sketch) for trial, m
+                            in enumerate(measures) if m.sketch)
+
+            # A single group of trials of a single statistic
+            shape = (1, len(measures), 1)
+            result, num, merged = summarize([id],
+                                            values.reshape(shape + (-1,)),
+                                            nums.reshape(shape),
+                                            np.ones(shape, dtype=np.bool_),
+                                            sketches, typemap, bootstrap)
+            self.store.values[self.index] = result[0, 0]
+            self.num = num[0, 0]
+            if merged:
+                self.sketch = merged[(0, 0)]
+
+    def __getitem__(self, type):
+        index = self.index + (self._type_index(type),)
+        return Measurement(store=self.store, index=index)
+
+    def __iter__(self):
+        for type in TYPES:
+            if type in self:
+                yield type, self[type]
+
+    def __contains__(self, type):
+        return not np.isnan(self.values[self._type_index(type)]).all()
+
+    def __setitem__(self, type, measure):
+        self.values[self._type_index(type)] = measure.values
+
+class CpuStats(object):
+    '''Measurements of a statistic on each of several CPUs. These are kept as
+    a row of CPU_TYPES values for each CPU, rather than as Measurements.'''
+    __slots__ = ['id', 'cpus', 'values', 'counts']
+
+    def __init__(self, id, cpus, measures):
+        self.id     = id
+        self.cpus   = np.array(cpus, dtype=np.int32)
+        self.values = np.array([[m[t] for t in CPU_TYPES] for m in measures],
+                               dtype=np.float64)
+        self.counts = np.array([m.num for m in measures], dtype=np.int64)
+
+    def __iter__(self):
+        '''Yield each CPU and a Measurement of its values.'''
+        for cpu, row, count in zip(self.cpus, self.values, self.counts):
+            measure = Measurement(self.id, dict(zip(CPU_TYPES, row)))
+            measure.num = int(count)
+            yield int(cpu), measure
+
+    def __len__(self):
+        return len(self.cpus)
+
+    def __getstate__(self):
+        return (self.id, self.cpus, self.values, self.counts)
+
+    def __setstate__(self, state):
+        self.id, self.cpus, self.values, self.counts = state
 
 class ExpPoint(object):
+    '''A map of names to measurements, all kept in a single Store.'''
+    __slots__ = ['id', 'default', 'store', 'rows', 'cpu_stats', 'histograms']
+
     def __init__(self, id = "", init = {}, default=Measurement):
-        self.stats = defaultdict(default)
+        # Class viewing each measurement in store
+        self.default = default
+        self.store = Store(default.SHAPE, 8)
+        # Map of names to their rows in store
+        self.rows  = {}
         for type, value in init.iteritems():
             self[type] = value
         self.id = id
+        # Map of statistics to their CpuStats
+        self.cpu_stats = {}
+        # Map of statistics to histograms of their values
+        self.histograms = {}
 
     def __check_val(self, obj):
         if not isinstance(obj, Measurement):
             raise AttributeError("Not a valid measurement '%s'" % obj)
 
+    def __row(self, type):
+        if type not in self.rows:
+            self.rows[type] = self.store.add(type)
+        return self.rows[type]
+
     def __getitem__(self, type):
-        return self.stats[type]
+        return self.default(store=self.store, index=(self.__row(type),))
 
     def __iter__(self):
-        return self.stats.iteritems()
+        for type in self.rows:
+            yield type, self[type]
 
     def __contains__(self, type):
-        return type in self.stats
+        return type in self.rows
 
     def __setitem__(self, type, value):
         self.__check_val(value)
-        self.stats[type] = value
+        self.set_values(type, value.values, value.num, value.sketch, value.id)
+
+    def set_values(self, type, values, num, sketch=None, id=None):
+        '''Store the values of a measurement of @type without creating a
+        Measurement for it.'''
+        row = self.__row(type)
+
+        self.store.values[row] = values
+        self.store.nums[row]   = num
+        self.store.ids[row]    = type if id is None else id
+        if sketch:
+            self.store.sketches[row] = sketch
 
     def __str__(self):
-        return "<ExpPoint-%s>\n%s" % (self.id, dict_str(self.stats))
+        stats = dict(self)
+        for name, cpu_stats in self.get_cpu_stats().iteritems():
+            for cpu, measure in cpu_stats.iteritems():
+                stats["%s[%d]" % (name, cpu)] = measure
+        return "<ExpPoint-%s>\n%s" % (self.id, dict_str(stats))
 
     def get_stats(self):
-        return self.stats.keys()
+        return self.rows.keys()
+
+    def get_cpu_stats(self):
+        '''Return a map of statistics to maps of CPUs to their measurements.'''
+        return dict((name, dict(stats))
+                    for name, stats in self.cpu_stats.iteritems())
+
+    def get_histograms(self):
+        return self.histograms
 
     def __bool__(self):
-        return bool(self.stats)
+        return bool(self.rows)
     __nonzero__ = __bool__
 
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in ExpPoint.__slots__)
+
+    def __setstate__(self, state):
+        # Points pickled before measurements were stored like this are
+        # missing these and must be parsed again
+        for name in ExpPoint.__slots__:
+            setattr(self, name, state[name])
+        if self.store.values.shape[-1] != len(TYPES):
+            raise ValueError("Point '%s' was stored with other types" % self.id)
+
 
 class SummaryPoint(ExpPoint):
-    def __init__(self, id="", points=[], typemap = default_typemap):
+    __slots__ = []
+
+    def __init__(self, id="", points=[], typemap = default_typemap,
+                 bootstrap = None):
         super(SummaryPoint,self).__init__("Summary-%s" % id,
                                           default=Summary)
+        if points:
+            summaries = summarize_points([points], typemap, bootstrap)[0]
+            self.add_summaries(points, summaries, typemap, bootstrap)
+
+    def add_summaries(self, points, summaries, typemap = default_typemap,
+                      bootstrap = None):
+        '''Store @summaries, a map of names to (values, num, sketch) from
+        summarize_points, and merge the histograms of @points. Names which
+        are (name, cpu) tuples are summaries of CPU statistics.'''
+        for name, (values, num, sketch) in summaries.iteritems():
+            if isinstance(name, tuple):
+                name, cpu = name
+                summary = Summary(name)
+                summary.store.values[summary.index] = values
+                summary.num = num
+                self.cpu_stats.setdefault(name, {})[cpu] = summary
+            else:
+                self.set_values(name, values, num, sketch)
 
         grouped = defaultdict(lambda : [])
 
         for exp in points:
-            for name,measure in exp.stats.iteritems():
-                grouped[name] += [measure]
-
-        for key in grouped.iterkeys():
-            self[key] = Summary(key, grouped[key], typemap)
+            for name, hist in exp.get_histograms().iteritems():
+                grouped[name] += [hist]
+
+        for name, hists in grouped.iteritems():
+            self.histograms[name] = histogram.merge(hists)
+
+def stack_points(groups):
+    '''Return the names of every statistic measured in the lists of
+    ExpPoints in @groups, and the arrays of their measurements passed to
+    summarize, with a trial for each point in a group. Each CPU of a CPU
+    statistic is a statistic of its own, named by a (name, cpu) tuple.'''
+    names = sorted(set(name for points in groups
+                       for exp in points for name in exp.rows))
+    names += sorted(set((name, int(cpu)) for points in groups
+                        for exp in points
+                        for name, stats in exp.cpu_stats.iteritems()
+                        for cpu in stats.cpus))
+    column = dict((name, i) for i, name in enumerate(names))
+    trials = max(len(points) for points in groups)
+
+    values   = np.full((len(groups), trials, len(names), len(TYPES)), np.nan)
+    nums     = np.zeros(values.shape[:3], dtype=np.int64)
+    present  = np.zeros(values.shape[:3], dtype=np.bool_)
+    sketches = {}
+
+    for group, points in enumerate(groups):
+        for trial, exp in enumerate(points):
+            if exp.rows:
+                stats, rows = zip(*exp.rows.iteritems())
+                stats = [column[name] for name in stats]
+                rows  = list(rows)
+
+                values[group, trial, stats]  = exp.store.values[rows]
+                nums[group, trial, stats]    = exp.store.nums[rows]
+                present[group, trial, stats] = True
+
+            for name, row in exp.rows.iteritems():
+                if row in exp.store.sketches:
+                    sketches[(group, trial, column[name])] = \
+                        exp.store.sketches[row]
+
+            for name, stats in exp.cpu_stats.iteritems():
+                if not len(stats):
+                    continue
+                cpus =[column[(name, int(cpu))] for cpu in stats.cpus]
+                values[group, trial][np.ix_(cpus, CPU_INDEX)] = stats.values
+                nums[group, trial, cpus]    = stats.counts
+                present[group, trial, cpus] = True
+
+    return names, values, nums, present, sketches
+
+def summarize_points(groups, typemap = default_typemap, bootstrap = None):
+    '''Summarize the statistics of each list of ExpPoints in @groups, all
+    groups at once, bootstrapping confidence intervals if @bootstrap is a
+    (resamples, seed) tuple. Return a map of each statistic in a group to
+    the values, number of values and sketch of its Summary, for each
+    group.'''
+    if not groups:
+        return []
+
+    names, values, nums, present, sketches = stack_points(groups)
+    result, num, merged = summarize(names, values, nums, present, sketches,
+                                    typemap, bootstrap)
+
+    summaries = []
+    measured  = present.any(axis=1)
+    for group in xrange(len(groups)):
+        summaries += [dict((names[stat], (result[group, stat],
+                                          num[group, stat],
+                                          merged.get((group, stat))))
+                           for stat in np.flatnonzero(measured[group]))]
+    return summaries
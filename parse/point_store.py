@@ -0,0 +1,60 @@
+'''
+Parsed experiments, stored as pickled ExpPoints in a single SQLite database
+shared by every process parsing experiments at once.
+'''
+import cache
+import pickle
+import sqlite3
+
+STORE_NAME = "points.db"
+
+# Seconds to wait for another process writing the database
+BUSY_TIMEOUT = 600
+
+# Keys looked up by a single query, below SQLite's limit on parameters
+QUERY_KEYS = 500
+
+SCHEMA = ["CREATE TABLE IF NOT EXISTS points (key TEXT PRIMARY KEY, "
+          "path TEXT, params TEXT, point BLOB)"]
+
+def params_str(params):
+    '''Return the same string for equal maps of @params.'''
+    return repr(sorted(params.iteritems()))
+
+class PointStore(object):
+    '''ExpPoints saved under keys from cache.point_key.'''
+    def __init__(self, store_dir):
+        cache.make_dirs(store_dir)
+
+        fname = "%s/%s" % (store_dir, STORE_NAME)
+        self.db = sqlite3.connect(fname, timeout=BUSY_TIMEOUT)
+        # Readers never block the process writing
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            for statement in SCHEMA:
+                self.db.execute(statement)
+
+    def __contains__(self, key):
+        return bool(self.db.execute("SELECT 1 FROM points WHERE key = ?",
+                                    (key,)).fetchone())
+
+    def save(self, key, path, params, point):
+        '''Save @point, parsed from @path with @params, under @key.'''
+        blob = sqlite3.Binary(pickle.dumps(point, pickle.HIGHEST_PROTOCOL))
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?)",
+                            (key, path, params_str(params), blob))
+
+    def load(self, keys):
+        '''Yield each key in @keys which has a point, and the point.'''
+        keys = list(keys)
+        for start in range(0, len(keys), QUERY_KEYS):
+            some = keys[start:start + QUERY_KEYS]
+            rows = self.db.execute("SELECT key, point FROM points " +
+                                   "WHERE key IN (%s)" %
+                                   ",".join("?" * len(some)), some)
+            for key, blob in rows:
+                yield key, pickle.loads(str(blob))
+
+    def close(self):
+        self.db.close()
@@ -1,63 +1,237 @@
 import config.config as conf
+import itertools
+import multiprocessing
+import numpy as np
 import os
 import re
-import struct
 import subprocess
 
 from collections import defaultdict,namedtuple
 from common import recordtype,log_once
 from point import Measurement
+from sketch import QuantileSketch
 from ctypes import *
 
-class TimeTracker:
+class TimeTracker(object):
     '''Store stats for durations of time demarcated by sched_trace records.'''
-    def __init__(self):
-        self.begin = self.avg = self.max = self.num = self.next_job = 0
-
-        # Count of times the job in start_time matched that in store_time
+    def __init__(self, starts, start_jobs, start_times,
+                 stores, store_jobs, store_whens):
+        '''Measure durations started by the records at indices @starts, of
+        @start_jobs at @start_times (or at the last match if 0), and stored
+        by the records at indices @stores, of @store_jobs at @store_whens.
+
+        A store matches if its job is that of the last start, or 0 once a
+        duration has been measured since that start. Measurements are
+        recorded in matching stores using the time of the previous match.
+        This way, the last record for any task is always skipped.'''
+        self.avg = self.max = self.num = 0
+
+        # Count of stores whose job matched
         self.matches = 0
-        # And the times it didn't
+        # And the stores whose job didn't
         self.disjoints = 0
 
-        # Measurements are recorded in store_ time using the previous matching
-        # record which was passed to store_time. This way, the last record for
-        # any task is always skipped
-        self.last_record = None
-
-    def store_time(self, next_record):
-        '''End duration of time.'''
-        dur = (self.last_record.when - self.begin) if self.last_record else -1
-
-        if self.next_job == next_record.job:
-            self.last_record = next_record
-
-            if self.last_record:
-                self.matches += 1
-
-            if dur > 0:
-                self.max  = max(self.max, dur)
-                self.avg *= float(self.num / (self.num + 1))
-                self.num += 1
-                self.avg += dur / float(self.num)
-
-                self.begin = 0
-                self.next_job   = 0
-        else:
-            self.disjoints += 1
-
-    def start_time(self, record, time = None):
-        '''Start duration of time.'''
-        if self.last_record:
-            if not time:
-                self.begin = self.last_record.when
-            else:
-                self.begin = time
-
-        self.next_job = record.job
+        # Durations of every matched job, zero for those with none
+        self.sketch = QuantileSketch()
+
+        # Stores between two starts make up a segment, numbered by the
+        # starts before them. Before the first start, job 0 is expected
+        segment  = np.searchsorted(starts, stores)
+        expected = np.concatenate(([0], start_jobs))
+        times    = np.concatenate(([0], start_times))
+
+        matched = store_jobs == expected[segment]
+        matches = np.flatnonzero(matched)
+        counts  = np.bincount(segment[matches], minlength=len(expected))
+
+        segments, firsts = np.unique(segment[matches], return_index=True)
+        first = np.full(len(expected), len(stores), dtype=np.int64)
+        first[segments] = matches[firsts]
+
+        # A duration measured in a segment makes job 0 match afterwards.
+        # Segments where that can matter are followed one store at a time,
+        # the rest match only on their first store of the expected job
+        zeros = np.flatnonzero(store_jobs == 0)
+        stepped = (counts > 1) | ((expected == 0) & (counts > 0))
+        stepped[segment[zeros[zeros > first[segment[zeros]]]]] = True
+
+        durations = np.zeros(len(stores), dtype=np.int64)
+        single = np.flatnonzero(matched & ~stepped[segment])
+
+        last = -1
+        for seg in np.flatnonzero(stepped):
+            low, high = np.searchsorted(segment, [seg, seg + 1])
+
+            # Last match before the segment, from either kind of segment
+            before = np.searchsorted(single, low) - 1
+            if before >= 0:
+                last = max(last, single[before])
+
+            job = expected[seg]
+            when = store_whens[last] if last >= 0 else None
+            begin = (times[seg] or when) if when is not None else 0
+
+            for i in range(low, high):
+                matched[i] = store_jobs[i] == job
+                if not matched[i]:
+                    continue
+
+                dur = (when - begin) if when is not None else -1
+                durations[i] = dur
+                when, last = store_whens[i], i
+
+                if dur > 0:
+                    begin = job = 0
+
+        # Each single match measures from the time of the match before it
+        matches = np.flatnonzero(matched)
+        before  = np.searchsorted(matches, single) - 1
+        when    = store_whens[matches[np.maximum(before, 0)]]
+        begin   = times[segment[single]]
+        durations[single] = np.where(before < 0, -1,
+                                     np.where(begin != 0, when - begin, 0))
+
+        values = durations[matched]
+        self.matches   = len(values)
+        self.disjoints = len(stores) - len(values)
+        self.sketch.add_values(np.maximum(values, 0))
+
+        values = values[values > 0]
+        if len(values):
+            self.num = len(values)
+            self.max = int(values.max())
+            self.avg = values.mean()
+
+class ValueTracker(object):
+    '''Store stats for an array of @values, and a sketch of their
+    distribution if @sketch is set.'''
+    def __init__(self, values, sketch=False):
+        self.num = len(values)
+        self.max = max(int(values.max()), 0) if self.num else 0
+        self.avg = values.mean() if self.num else 0
+        self.sketch = QuantileSketch().add_values(values) if sketch else None
+
+def job_keys(jobs, rows):
+    '''Return keys which order @rows, indices of records of @jobs, by job
+    and then by index.'''
+    return (jobs.astype(np.uint64) << np.uint64(32)) | rows.astype(np.uint64)
+
+def sort_by_job(jobs, rows):
+    '''Return @rows, indices of records in order, sorted by their @jobs, and
+    the keys of the sorted rows.'''
+    rows = rows[np.argsort(jobs[rows], kind='mergesort')]
+    return rows, job_keys(jobs[rows], rows)
+
+def find_windows(keys, starts, ends):
+    '''Return the ranges of rows with sorted @keys which lie strictly
+    between the rows with keys @starts and @ends.'''
+    return (np.searchsorted(keys, starts, 'right'),
+            np.searchsorted(keys, ends, 'left'))
+
+def range_max(values, starts, ends):
+    '''Return the max of values[start:end] for each of @starts and @ends, or
+    -1 for empty ranges. Runs of doubling length are maxed in turn, so each
+    range is covered by two overlapping runs.'''
+    result  = np.full(len(starts), -1, dtype=np.int64)
+    lengths = ends - starts
+
+    runs, span = values, 1
+    while True:
+        covered = (lengths >= span) & (lengths < 2 * span)
+        result[covered] = np.maximum(runs[starts[covered]],
+                                     runs[ends[covered] - span])
+        if not (lengths >= 2 * span).any():
+            return result
+
+        runs  = np.maximum(runs[:-span], runs[span:])
+        span *= 2
+
+class JobTracker(object):
+    '''Store per-job stats for the jobs of one task, following each job from
+    its release to its completion.'''
+    def __init__(self, records, releases, periods):
+        '''Follow the jobs in @records which were started by the releases at
+        indices @releases, made while the task had @periods.'''
+        rows  = np.arange(len(records))
+        types = records['type']
+        jobs  = records['job'].astype(np.int64)
+        whens = records.view(WHEN_DTYPE)['when'].astype(np.int64)
+
+        # Lateness of each release relative to the one before it
+        job, when = jobs[releases], whens[releases]
+        late = np.maximum(when[1:] - when[:-1] - periods[1:], 0)
+        self.jitter = ValueTracker(late[(job[1:] == job[:-1] + 1) &
+                                        (periods[1:] != 0)])
+
+        # Each completion finishes the last release of its job before it
+        completions = np.flatnonzero(types == CompletionRecord.ID)
+        done = jobs[completions]
+        started, keys = sort_by_job(jobs, releases)
+        found = np.searchsorted(keys, job_keys(done, completions)) - 1
+        release = started[np.maximum(found, 0)] if len(started) else found
+        valid = (found >= 0) & (jobs[release] == done)
+
+        # Unless the job, or a later one, completed in between. Jobs complete
+        # in order, so any earlier job lost its completion
+        before = np.maximum.accumulate(np.concatenate(([-1], done)))[:-1]
+        check  = np.flatnonzero(valid & (before >= done))
+        if len(check):
+            after = np.searchsorted(completions, release[check], 'right')
+            valid[check] = range_max(done, after, check) < done[check]
+
+        completions, release, done = (completions[valid], release[valid],
+                                      done[valid])
+        first = job_keys(done, release)
+        last  = job_keys(done, completions)
+        ended = whens[completions]
+
+        switch_to, keys = sort_by_job(jobs, rows[types == SwitchToRecord.ID])
+        low, high = find_windows(keys, first, last)
+        switches = high - low
+
+        # Moves between switches to the job within its window
+        cpus  = records['cpu'][switch_to]
+        moved = np.cumsum(np.concatenate(([0, 0], cpus[1:] != cpus[:-1])))
+        migrations = moved[high] - moved[np.minimum(low + 1, high)]
+
+        resumes, keys = sort_by_job(jobs, rows[types == ResumeRecord.ID])
+        low, high = find_windows(keys, first, last)
+        resumes = high - low
+
+        # Time between each switch to the job and the switch away after it
+        switched = (types == SwitchToRecord.ID) | \
+                   (types == SwitchAwayRecord.ID)
+        switched, keys = sort_by_job(jobs, rows[switched])
+        low, high = find_windows(keys, first, last)
+
+        to   = np.concatenate(([False], types[switched] == SwitchToRecord.ID))
+        when = np.concatenate(([0], whens[switched]))
+        ran  = np.where(to[:-1] & ~to[1:], np.diff(when), 0)
+        ran  = np.cumsum(np.concatenate(([0], ran)))
+        measured = ran[high] - ran[np.minimum(low + 1, high)]
+
+        # Switch away was recorded after completion
+        running  = to[high] & (high > low)
+        measured += np.where(running, ended - when[high], 0)
+
+        # An exec time of 0 means the kernel did not record one, so the time
+        # between switches is used instead
+        exec_time = records.view(CompletionRecord.DTYPE)['flags'][completions]
+        exec_time = (exec_time >> np.uint64(1)).astype(np.int64)
+        exec_time = np.where(exec_time != 0, exec_time, measured)
+
+        # Only response times are kept as a distribution, for job-response
+        self.response    = ValueTracker(ended - whens[release], sketch=True)
+        self.exec_time   = ValueTracker(exec_time)
+        self.migrations  = ValueTracker(migrations)
+        # Every scheduling of the job after its first is due to either a
+        # preemption or the job resuming from a block
+        self.preemptions = ValueTracker(np.maximum(switches - 1 - resumes, 0))
 
 # Data stored for each task
 TaskParams = namedtuple('TaskParams',  ['wcet', 'period', 'cpu'])
-TaskData   = recordtype('TaskData',    ['params', 'jobs', 'blocks', 'misses'])
+TaskData   = recordtype('TaskData',    ['params', 'jobs', 'blocks', 'misses',
+                                        'job_stats'])
 
 # Map of event ids to corresponding class and format
 record_map = {}
@@ -65,184 +239,458 @@ record_map = {}
 RECORD_SIZE   = 24
 NSEC_PER_MSEC = 1000000
 
-def bits_to_bytes(bits):
-    '''Includes padding'''
-    return bits / 8 + (1 if bits%8 else 0)
-
-def field_bytes(fields):
-    fbytes = 0
-    fbits  = 0
-    for f in fields:
-        flist = list(f)
-
-        if len(flist) > 2:
-            # Specified a bitfield
-            fbits += flist[2]
-        else:
-            # Only specified a type, use types size
-            fbytes += sizeof(list(f)[1])
-
-            # Bitfields followed by a byte will cause any incomplete
-            # bytes to be turned into full bytes
-            fbytes += bits_to_bytes(fbits)
-            fbits   = 0
-
-    fbytes += bits_to_bytes(fbits)
-    return fbytes + fbits
+# Records per block of a sched-trace file index
+INDEX_STRIDE  = 1024
+
+def field_dtype(ctype):
+    '''Convert a single ctypes type into a little-endian numpy dtype.'''
+    dtype = np.dtype(ctype)
+    if dtype.subdtype and dtype.subdtype[0].char == 'S':
+        # Arrays of characters are strings
+        return np.dtype('S%d' % sizeof(ctype))
+    return dtype.newbyteorder('<')
+
+def make_dtype(fields):
+    '''Convert ctypes @fields into a packed little-endian numpy dtype which
+    is padded out to the size of a record.'''
+    names   = [f[0] for f in fields]
+    formats = [field_dtype(f[1]) for f in fields]
+    return np.dtype({'names'   : names,
+                     'formats' : formats,
+                     'itemsize': RECORD_SIZE})
 
 def register_record(id, clazz):
-    fields = clazz.FIELDS
-    diff = RECORD_SIZE - field_bytes(SchedRecord.FIELDS) - field_bytes(fields)
-
-    # Create extra padding fields to make record the proper size
-    # Creating one big field of c_uint64 and giving it a size of 8*diff
-    # _should_ work, but doesn't. This is an uglier way of accomplishing
-    # the same goal
-    for d in range(diff):
-        fields += [("extra%d" % d, c_char)]
-
-    # Create structure with fields and methods of clazz
-    clazz2 = type("Dummy%d" % id, (LittleEndianStructure,clazz),
-                  {'_fields_': SchedRecord.FIELDS + fields,
-                   '_pack_'  : 1})
-    record_map[id] = clazz2
-
-def make_iterator(fname):
-    '''Iterate over (parsed record, processing method) in a
-    sched-trace file.'''
-    if not os.path.getsize(fname):
-        # Likely a release master CPU
-        return
+    clazz.ID    = id
+    clazz.DTYPE = make_dtype(SchedRecord.FIELDS + clazz.FIELDS)
+    record_map[id] = clazz
+
+class TraceIndex(object):
+    '''Sparse time index of a sched-trace file. Records are grouped into
+    blocks of @stride records. For each block, the index stores the latest
+    time seen in it or any earlier block, and the earliest time seen in it
+    or any later block. Both are sorted, so the blocks which may hold
+    records from a window of time can be found with binary searches, even
+    if the file is not perfectly ordered by time.'''
+
+    VERSION = 2
+
+    # Records which describe tasks or the experiment rather than jobs. These
+    # can be found without decoding the whole file, and are excluded from
+    # the index as they either have no time or precede the experiment
+    META_RECORDS = [1, 2, 11]
+
+    def __init__(self, stride, max_when, min_when, meta):
+        self.stride   = stride
+        self.max_when = max_when
+        self.min_when = min_when
+        self.meta     = meta
+
+    def find(self, start, end):
+        '''Return the range of records which may lie in [@start, @end].'''
+        first = np.searchsorted(self.max_when, np.uint64(start), 'left')
+        last  = np.searchsorted(self.min_when, np.uint64(end), 'right')
+        return (first * self.stride, max(first, last) * self.stride)
+
+    @staticmethod
+    def build(data, stride=INDEX_STRIDE):
+        '''Index @data, an array of records, in one pass over its blocks.'''
+        blocks = range(0, len(data), stride)
+        max_when = np.zeros(len(blocks), dtype=np.uint64)
+        min_when = np.zeros(len(blocks), dtype=np.uint64)
+        meta = []
+
+        for i, first in enumerate(blocks):
+            block = data[first:first + stride]
+            whens = block.view(WHEN_DTYPE)['when']
+            timed = ~np.in1d(block['type'], TraceIndex.META_RECORDS)
+
+            if timed.any():
+                max_when[i] = whens[timed].max()
+                min_when[i] = whens[timed].min()
+            else:
+                min_when[i] = np.iinfo(np.uint64).max
+            meta += [first + np.flatnonzero(~timed)]
 
-    f = open(fname, 'rb')
+        max_when = np.maximum.accumulate(max_when)
+        min_when = np.minimum.accumulate(min_when[::-1])[::-1]
 
-    while True:
-        data = f.read(RECORD_SIZE)
+        return TraceIndex(stride, max_when, min_when, np.concatenate(meta))
 
-        try:
-            type_num = struct.unpack_from('b',data)[0]
-        except struct.error:
-            break
+    @staticmethod
+    def load(fname, data):
+        '''Load the index of sched-trace file @fname, which has been mapped
+        into @data. The index is rebuilt and saved next to @fname if it is
+        missing or older than the file.'''
+        index_fname = "%s.idx" % fname
+        stat = os.stat(fname)
+        source = np.array([TraceIndex.VERSION, stat.st_size, stat.st_mtime])
 
-        if type_num not in record_map:
-            continue
+        try:
+            with np.load(index_fname) as saved:
+                if np.array_equal(saved['source'], source):
+                    return TraceIndex(int(saved['stride']), saved['max_when'],
+                                      saved['min_when'], saved['meta'])
+        except Exception:
+            # Missing or unreadable, so rebuild it
+            pass
 
-        clazz = record_map[type_num]
-        obj = clazz()
-        obj.fill(data)
+        index = TraceIndex.build(data)
 
-        if obj.job != 1:
-            yield obj
-        else:
-            # Results from the first job are nonsense
+        try:
+            with open(index_fname, 'wb') as f:
+                np.savez(f, source=source, stride=index.stride,
+                         max_when=index.max_when, min_when=index.min_when,
+                         meta=index.meta)
+        except IOError:
+            # Likely a read-only data directory, the index is just slower
             pass
 
-def read_data(task_dict, fnames):
-    '''Read records from @fnames and store per-pid stats in @task_dict.'''
-    buff = []
+        return index
 
-    def get_time(record):
-        return record.when if hasattr(record, 'when') else 0
+def map_file(fname):
+    '''Map the records of sched-trace file @fname into an array, or return
+    None if it holds no records.'''
+    num_records = os.path.getsize(fname) / RECORD_SIZE
+    if not num_records:
+        return None
 
-    def add_record(itera):
-        # Ordered insertion into buff
-        try:
-            arecord = itera.next()
-        except StopIteration:
-            return
+    return np.memmap(fname, dtype=RECORD_DTYPE, mode='r',
+                     shape=(num_records,))
 
-        i = 0
-        for (i, (brecord, _)) in enumerate(buff):
-            if get_time(brecord) > get_time(arecord):
-                break
-        buff.insert(i, (arecord, itera))
+def find_bounds(fnames):
+    '''Return the time of the synchronous release and the time of the last
+    record in sched-trace files @fnames. If the release was not traced, the
+    time of the first record is used instead.'''
+    releases, firsts, lasts = [], [], []
 
     for fname in fnames:
-        itera = make_iterator(fname)
-        add_record(itera)
-
-    while buff:
-        record, itera = buff.pop(0)
+        data = map_file(fname)
+        if data is None:
+            continue
 
-        add_record(itera)
-        record.process(task_dict)
+        index = TraceIndex.load(fname, data)
+        firsts += [index.min_when[0]]
+        lasts  += [index.max_when[-1]]
+
+        meta = data.view(record_map[11].DTYPE)[index.meta]
+        releases += meta[meta['type'] == 11]['release'].tolist()
+
+    # Files without any timed records have no bounds
+    firsts = [f for f in firsts if f != np.iinfo(np.uint64).max]
+    if not firsts:
+        return (None, None)
+
+    release = min(releases) if releases else min(firsts)
+    return (long(release), long(max(lasts)))
+
+def in_window(records, window):
+    '''Return a mask of @records which happened in @window. Records
+    without times are always in it.'''
+    whens = records.view(WHEN_DTYPE)['when']
+    timed = ~np.in1d(records['type'], UNTIMED_RECORDS)
+    return ~timed | ((whens >= window[0]) & (whens <= window[1]))
+
+def read_records(fname, window=None):
+    '''Decode every registered record in sched-trace file @fname at once,
+    into an array of RECORD_DTYPE in file order. If @window is a (start,
+    end) pair of times, only records which happened in that window are
+    decoded, along with any records without times.'''
+    data = map_file(fname)
+    if data is None:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+
+    if window:
+        # Slicing the mapped file is free, only the kept records are copied
+        index = TraceIndex.load(fname, data)
+        first, last = index.find(*window)
+        meta  = index.meta
+        parts = [data[meta[meta < first]], data[first:last],
+                 data[meta[meta >= last]]]
+    else:
+        parts = [data]
+
+    found = []
+    for part in parts:
+        # Results from the first job are nonsense
+        keep = np.in1d(part['type'], record_map.keys()) & (part['job'] != 1)
+        if window:
+            keep &= in_window(part, window)
+        found += [np.asarray(part[keep])]
+
+    return np.concatenate(found)
+
+def merge_keys(records):
+    '''Return keys which order @records, read from one file, among those
+    of other files. Each file is read in order, and a record is processed
+    once the time of every record before it in its file has passed, so its
+    key is the latest of those times. Records without times are processed
+    as soon as they are read.'''
+    whens = records.view(WHEN_DTYPE)['when'].copy()
+    whens[np.in1d(records['type'], UNTIMED_RECORDS)] = 0
+    return np.maximum.accumulate(whens)
+
+def group_records(decode_args):
+    '''Read records in a window from a sched-trace file, as in read_records,
+    and group those which change statistics by task. Returns a map of pids
+    to the merge keys and records of each task, in file order.'''
+    # Tupled for multiprocessing
+    records = read_records(*decode_args)
+    keys    = merge_keys(records)
+
+    # Only dropped now, as they still delay the records after them
+    used = ~np.in1d(records['type'], IGNORED_RECORDS)
+    records, keys = records[used], keys[used]
+
+    order = np.argsort(records['pid'], kind='mergesort')
+    pids, starts = np.unique(records['pid'][order], return_index=True)
+
+    groups = {}
+    for pid, rows in zip(pids.tolist(), np.split(order, starts[1:])):
+        groups[pid] = (keys[rows], records[rows])
+    return groups
+
+def fold_records(records):
+    '''Return the TaskData of a task from its @records, in the order they
+    are processed. Each statistic is computed from the columns of the
+    records it uses.'''
+    types = records['type']
+    jobs  = records['job'].astype(np.int64)
+    whens = records.view(WHEN_DTYPE)['when'].astype(np.int64)
+    rows  = np.arange(len(records))
+
+    # Index of the parameters in force at each record, -1 before any
+    params = np.where(types == ParamRecord.ID, rows, -1)
+    params = np.maximum.accumulate(params)
+    periods = records.view(ParamRecord.DTYPE)['period'].astype(np.int64)
+
+    releases = np.flatnonzero(types == ReleaseRecord.ID)
+    data = TaskData(None, 1 + len(releases), None, None, None)
+
+    if len(records) and params[-1] >= 0:
+        param = records.view(ParamRecord.DTYPE)[params[-1]]
+        data.params = TaskParams(int(param['wcet']),
+                                 int(param['period']),
+                                 int(param['partition']))
+
+    # Jobs are only followed from releases with known parameters
+    releases = releases[params[releases] >= 0]
+    periods  = periods[params[releases]]
+
+    completions = np.flatnonzero(types == CompletionRecord.ID)
+    data.misses = TimeTracker(releases, jobs[releases],
+                              whens[releases] + periods, completions,
+                              jobs[completions], whens[completions])
+
+    blocks  = np.flatnonzero(types == BlockRecord.ID)
+    resumes = np.flatnonzero(types == ResumeRecord.ID)
+    data.blocks = TimeTracker(blocks, jobs[blocks],
+                              np.zeros(len(blocks), dtype=np.int64), resumes,
+                              jobs[resumes], whens[resumes])
+
+    data.job_stats = JobTracker(records, releases, periods)
+    return data
+
+def fold_task(task_records):
+    '''Return the pid and TaskData of a task from (pid, merge keys,
+    records), with the records of each file following those of the last.'''
+    # Tupled for multiprocessing
+    pid, keys, records = task_records
+
+    # Stable, so records of different files with the same key are
+    # processed in file order
+    records = records[np.argsort(keys, kind='mergesort')]
+    return (pid, fold_records(records))
+
+def fold_files(task_dict, fnames, window, pool=None):
+    '''Store the stats of each task with records in @window of @fnames in
+    @task_dict. Files are decoded, then tasks folded, by @pool if given.'''
+    decode_args = zip(fnames, [window]*len(fnames))
+    imap = pool.imap if pool else itertools.imap
+
+    # Records of each task from every file, in the order of @fnames
+    found = defaultdict(list)
+    for groups in imap(group_records, decode_args):
+        for pid, group in groups.iteritems():
+            found[pid] += [group]
+
+    tasks = []
+    while found:
+        # Popped, so only one copy of the records is kept
+        pid, groups = found.popitem()
+        keys, records = [np.concatenate(g) for g in zip(*groups)]
+        tasks += [(pid, keys, records)]
+
+    # Largest first, so no process is left folding one at the end
+    tasks.sort(key=lambda task: len(task[2]), reverse=True)
+
+    imap = pool.imap_unordered if pool else itertools.imap
+    for pid, data in imap(fold_task, tasks):
+        task_dict[pid] = data
+
+def read_data(task_dict, fnames, window=None, procs=1):
+    '''Read records from @fnames and store per-pid stats in @task_dict.
+    Only records in @window, a (start, end) pair of times, are read. Up to
+    @procs processes decode the files, then fold the records of each task
+    into its stats, which are merged in this one.'''
+    if procs > 1:
+        pool = multiprocessing.Pool(processes=procs)
+        try:
+            fold_files(task_dict, fnames, window, pool)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        fold_files(task_dict, fnames, window)
 
 class SchedRecord(object):
     # Subclasses will have their FIELDs merged into this one
     FIELDS = [('type', c_uint8),  ('cpu', c_uint8),
               ('pid',  c_uint16), ('job', c_uint32)]
 
-    def fill(self, data):
-        memmove(addressof(self), data, RECORD_SIZE)
+    # Whether fold_records uses records of this type
+    STATS  = True
+
+class NameRecord(SchedRecord):
+    FIELDS = [('cmd', c_char * 16)]
 
-    def process(self, task_dict):
-        raise NotImplementedError()
+    # No statistics use task names
+    STATS  = False
 
 class ParamRecord(SchedRecord):
     FIELDS = [('wcet', c_uint32),  ('period', c_uint32),
               ('phase', c_uint32), ('partition', c_uint8)]
 
-    def process(self, task_dict):
-        params = TaskParams(self.wcet, self.period, self.partition)
-        task_dict[self.pid].params = params
-
 class ReleaseRecord(SchedRecord):
     FIELDS = [('when', c_uint64), ('release', c_uint64)]
 
-    def process(self, task_dict):
-        data = task_dict[self.pid]
-        data.jobs += 1
-        if data.params:
-            data.misses.start_time(self, self.when + data.params.period)
+class AssignedRecord(SchedRecord):
+    FIELDS = [('when', c_uint64), ('target', c_uint16)]
 
-class CompletionRecord(SchedRecord):
-    FIELDS = [('when', c_uint64)]
+    # Job stats follow jobs through switch_to records instead
+    STATS  = False
 
-    def process(self, task_dict):
-        task_dict[self.pid].misses.store_time(self)
+class SwitchToRecord(SchedRecord):
+    FIELDS = [('when', c_uint64), ('exec_time', c_uint32)]
+
+class SwitchAwayRecord(SchedRecord):
+    FIELDS = [('when', c_uint64), ('exec_time', c_uint64)]
+
+class CompletionRecord(SchedRecord):
+    # The lowest bit of flags marks forced completions, the rest of the
+    # bits hold the execution time of the job
+    FIELDS = [('when', c_uint64), ('flags', c_uint64)]
 
 class BlockRecord(SchedRecord):
     FIELDS = [('when', c_uint64)]
 
-    def process(self, task_dict):
-        task_dict[self.pid].blocks.start_time(self)
-
 class ResumeRecord(SchedRecord):
     FIELDS = [('when', c_uint64)]
 
-    def process(self, task_dict):
-        task_dict[self.pid].blocks.store_time(self)
+class ActionRecord(SchedRecord):
+    FIELDS = [('when', c_uint64), ('action', c_uint8)]
+
+    # Actions are plugin-specific, so no statistics use them
+    STATS  = False
+
+class SysReleaseRecord(SchedRecord):
+    FIELDS = [('when', c_uint64), ('release', c_uint64)]
+
+    # Only used to find the start of the experiment
+    STATS  = False
+
+# All records but those without times begin with when
+WHEN_DTYPE   = make_dtype(SchedRecord.FIELDS + [('when', c_uint64)])
+# Whole records, which can be viewed as any type. Copies of a dtype with
+# only the header fields would leave out the rest of each record
+RECORD_DTYPE = make_dtype(SchedRecord.FIELDS + [('body', c_uint8 * 16)])
 
 # Map records to sched_trace ids (see include/litmus/sched_trace.h
+register_record(1, NameRecord)
 register_record(2, ParamRecord)
 register_record(3, ReleaseRecord)
+register_record(4, AssignedRecord)
+register_record(5, SwitchToRecord)
+register_record(6, SwitchAwayRecord)
 register_record(7, CompletionRecord)
 register_record(8, BlockRecord)
 register_record(9, ResumeRecord)
+register_record(10, ActionRecord)
+register_record(11, SysReleaseRecord)
+
+UNTIMED_RECORDS = [id for id, clazz in record_map.iteritems()
+                   if 'when' not in clazz.DTYPE.names]
+IGNORED_RECORDS = [id for id, clazz in record_map.iteritems()
+                   if not clazz.STATS]
+
+def get_window(fnames, skip):
+    '''Convert @skip, a pair of milliseconds to ignore after the synchronous
+    release and before the end of sched-trace files @fnames, into a window
+    of times for records to be read from.'''
+    release, end = find_bounds(fnames)
+    if release is None:
+        return None
+
+    head, tail = [int(ms * NSEC_PER_MSEC) for ms in skip]
+    return (release + head, end - tail)
+
+def start_st_show(data_dir, bin_names, output_file):
+    '''Start writing an in-english version of the data for debugging into
+    @output_file. Returns the running process, or None if 'st_show' is not
+    in PATH.'''
+    if not conf.BINS['st_show']:
+        log_once("st_show not found in PATH, skipping text dump of "
+                 "sched-trace data")
+        return None
+
+    cmd_arr = [conf.BINS['st_show']]
+    cmd_arr.extend(bin_names)
+    with open(output_file, "w") as f:
+        return subprocess.Popen(cmd_arr, cwd=data_dir, stdout=f)
+
+def find_bin_names(data_dir):
+    '''Return the names of the sched trace files in @data_dir.'''
+    bin_files = conf.FILES['sched_data'].format(".*") + "$"
+    return [f for f in os.listdir(data_dir) if re.match(bin_files, f)]
+
+def show_sched_data(data_dir, work_dir):
+    '''Dump the sched trace files in @data_dir as text into @work_dir using
+    st_show, without parsing them.'''
+    bin_names = find_bin_names(data_dir)
+    if not bin_names:
+        return
+
+    st_show = start_st_show(data_dir, bin_names, "%s/out-st" % work_dir)
+    if st_show:
+        st_show.wait()
 
-def create_task_dict(data_dir, work_dir = None):
-    '''Parse sched trace files'''
-    bin_files   = conf.FILES['sched_data'].format(".*")
+def create_task_dict(data_dir, work_dir = None, skip = None, procs = 1,
+                     show = False):
+    '''Parse sched trace files using up to @procs processes. If @skip is
+    given, ignore records within (head, tail) milliseconds of the start and
+    end of the experiment. If @show, also dump the files as text into
+    @work_dir using st_show while they are parsed.'''
     output_file = "%s/out-st" % work_dir
 
-    task_dict = defaultdict(lambda :
-                            TaskData(None, 1, TimeTracker(), TimeTracker()))
+    task_dict = {}
 
-    bin_names = [f for f in os.listdir(data_dir) if re.match(bin_files, f)]
+    bin_names = find_bin_names(data_dir)
     if not len(bin_names):
         return task_dict
 
-    # Save an in-english version of the data for debugging
-    # This is optional and will only be done if 'st_show' is in PATH
-    if conf.BINS['st_show']:
-        cmd_arr = [conf.BINS['st_show']]
-        cmd_arr.extend(bin_names)
-        with open(output_file, "w") as f:
-            subprocess.call(cmd_arr, cwd=data_dir, stdout=f)
+    # The dump runs in the background while the data is parsed here
+    st_show = start_st_show(data_dir, bin_names, output_file) if show else None
 
-    # Gather per-task values
-    bin_paths = ["%s/%s" % (data_dir,f) for f in bin_names]
-    read_data(task_dict, bin_paths)
+    try:
+        # Gather per-task values
+        bin_paths = ["%s/%s" % (data_dir,f) for f in bin_names]
+        window    = get_window(bin_paths, skip) if skip else None
+        read_data(task_dict, bin_paths, window, procs)
+    finally:
+        if st_show:
+            st_show.wait()
 
     return task_dict
 
@@ -252,9 +700,12 @@ SKIP_MSG = """Measurement '%s' has no non-zero values.
 Measurements like these are not included in scheduling statistics.
 If a measurement is missing, this is why."""
 
-def extract_sched_data(result, data_dir, work_dir):
-    task_dict = create_task_dict(data_dir, work_dir)
+def extract_sched_data(result, data_dir, work_dir, skip = None, procs = 1,
+                       show = False):
+    task_dict = create_task_dict(data_dir, work_dir, skip, procs, show)
     stat_data = defaultdict(list)
+    # Distributions of per-job values across all tasks
+    job_data  = defaultdict(QuantileSketch)
 
     # Group per-task values
     for tdata in task_dict.itervalues():
@@ -263,6 +714,9 @@ def extract_sched_data(result, data_dir, work_dir):
             continue
 
         miss = tdata.misses
+        if not (miss.matches + miss.disjoints):
+            # No jobs completed inside the analysis window
+            continue
 
         record_loss = float(miss.disjoints)/(miss.matches + miss.disjoints)
         stat_data["record-loss"].append(record_loss)
@@ -276,15 +730,49 @@ def extract_sched_data(result, data_dir, work_dir):
 
         stat_data["miss-ratio" ].append(miss_ratio)
 
+        job_data["job-tard"].merge(miss.sketch)
+        job_data["job-block"].merge(tdata.blocks.sketch)
+
         stat_data["max-tard"].append(miss.max / tdata.params.period)
         stat_data["avg-tard"].append(avg_tard / tdata.params.period)
 
         stat_data["avg-block"].append(tdata.blocks.avg / NSEC_PER_MSEC)
         stat_data["max-block"].append(tdata.blocks.max / NSEC_PER_MSEC)
 
+        jobs = tdata.job_stats
+        if not jobs.response.num:
+            continue
+
+        period = float(tdata.params.period)
+
+        job_data["job-response"].merge(jobs.response.sketch)
+
+        stat_data["avg-response"].append(jobs.response.avg / period)
+        stat_data["max-response"].append(jobs.response.max / period)
+
+        if tdata.params.wcet:
+            wcet = float(tdata.params.wcet)
+            stat_data["avg-exec"].append(jobs.exec_time.avg / wcet)
+            stat_data["max-exec"].append(jobs.exec_time.max / wcet)
+
+        stat_data["avg-preemptions"].append(jobs.preemptions.avg)
+        stat_data["avg-migrations"].append(jobs.migrations.avg)
+
+        if jobs.jitter.num:
+            stat_data["avg-jitter"].append(jobs.jitter.avg / NSEC_PER_MSEC)
+            stat_data["max-jitter"].append(jobs.jitter.max / NSEC_PER_MSEC)
+
     # Summarize value groups
     for name, data in stat_data.iteritems():
         if not data or not sum(data):
             log_once(SKIP_MSG, SKIP_MSG % name)
             continue
-        result[name] = Measurement(str(name)).from_array(data)
+        result[name] = Measurement(str(name)).from_array(data, sketch=False)
+
+    # Summarize job distributions, in milliseconds
+    for name, sketch in job_data.iteritems():
+        if not sketch.max:
+            log_once(SKIP_MSG, SKIP_MSG % name)
+            continue
+        measure = Measurement(str(name))
+        result[name] = measure.from_sketch(sketch, 1.0 / NSEC_PER_MSEC)
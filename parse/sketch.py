@@ -0,0 +1,158 @@
+import math
+import numpy as np
+
+from collections import defaultdict
+
+class QuantileSketch(object):
+    '''Summarize a stream of non-negative values in bounded memory.
+
+    Values are counted in buckets whose bounds grow geometrically, so any
+    quantile is estimated to within @accuracy of its true value (relative
+    error). Sketches with the same accuracy merge exactly by adding bucket
+    counts. Count, min and max are tracked exactly, and mean and variance
+    without the error of the buckets.
+
+    If more than @max_buckets buckets are needed, the lowest are collapsed
+    together, which only loses accuracy for the smallest values.
+    '''
+    def __init__(self, accuracy=.01, max_buckets=2048):
+        self.accuracy    = accuracy
+        self.max_buckets = max_buckets
+        self.log_gamma   = math.log((1 + accuracy) / (1 - accuracy))
+
+        self.buckets = defaultdict(int)
+        self.zeros   = 0
+
+        self.num     = 0
+        # Mean and sum of squared differences from it, updated as in
+        # point.array_stats so the variance keeps its precision
+        self.avg     = self.m2 = 0.0
+        self.min     = self.max = 0
+
+    def __bucket(self, value):
+        return int(math.ceil(math.log(value) / self.log_gamma))
+
+    def __value(self, bucket):
+        '''Estimate of the values counted in @bucket.'''
+        gamma = math.exp(self.log_gamma)
+        return 2 * gamma ** bucket / (gamma + 1)
+
+    def __combine(self, num, avg, m2):
+        '''Add the moments of @num values with mean @avg and sum of squared
+        differences @m2 to those of this sketch.'''
+        total = self.num + num
+        delta = avg - self.avg
+        self.avg += delta * num / total
+        self.m2  += m2 + delta * delta * self.num * num / total
+        self.num  = total
+
+    def __collapse(self):
+        keys = sorted(self.buckets.keys())
+        while len(keys) > self.max_buckets:
+            lowest = keys.pop(0)
+            self.buckets[keys[0]] += self.buckets.pop(lowest)
+
+    def add(self, value, count=1):
+        '''Add @count occurrences of @value to the sketch.'''
+        value = max(value, 0)
+
+        self.min = min(self.min, value) if self.num else value
+        self.max = max(self.max, value)
+        self.__combine(count, float(value), 0.0)
+
+        if value:
+            self.buckets[self.__bucket(value)] += count
+            if len(self.buckets) > self.max_buckets:
+                self.__collapse()
+        else:
+            self.zeros += count
+
+    def add_values(self, values):
+        '''Add every value in array @values to the sketch at once.'''
+        values = np.maximum(np.asarray(values, dtype=np.float64), 0)
+        if not len(values):
+            return self
+
+        low, high = float(values.min()), float(values.max())
+        self.min = min(self.min, low) if self.num else low
+        self.max = max(self.max, high)
+        diffs = values - values.mean()
+        self.__combine(len(values), values.mean(), np.dot(diffs, diffs))
+
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+
+        buckets = np.ceil(np.log(positive) / self.log_gamma).astype(np.int64)
+        for bucket, count in zip(*np.unique(buckets, return_counts=True)):
+            self.buckets[int(bucket)] += int(count)
+        if len(self.buckets) > self.max_buckets:
+            self.__collapse()
+
+        return self
+
+    def merge(self, other):
+        '''Add all values in sketch @other to this one.'''
+        if other.accuracy != self.accuracy:
+            raise ValueError("Cannot merge sketches of different accuracy")
+        if not other.num:
+            return self
+
+        self.min = min(self.min, other.min) if self.num else other.min
+        self.max = max(self.max, other.max)
+        self.__combine(other.num, other.avg, other.m2)
+
+        self.zeros += other.zeros
+        for bucket, count in other.buckets.iteritems():
+            self.buckets[bucket] += count
+        if len(self.buckets) > self.max_buckets:
+            self.__collapse()
+
+        return self
+
+    def scaled(self, factor):
+        '''Return a copy of this sketch with every value multiplied by
+        @factor. Values are re-bucketed, which can double the error.'''
+        result = QuantileSketch(self.accuracy, self.max_buckets)
+
+        result.zeros = self.zeros
+        for bucket, count in self.buckets.iteritems():
+            result.buckets[result.__bucket(self.__value(bucket) * factor)] += count
+
+        result.num = self.num
+        result.min = self.min * factor
+        result.max = self.max * factor
+        result.avg = self.avg * factor
+        result.m2  = self.m2 * factor * factor
+
+        return result
+
+    def mean(self):
+        return self.avg if self.num else 0
+
+    def var(self):
+        return self.m2 / self.num if self.num else 0
+
+    def quantile(self, q):
+        '''Estimate the value below which a fraction @q of values lie.'''
+        if not self.num:
+            return 0
+
+        rank = q * (self.num - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+
+        for bucket in sorted(self.buckets.keys()):
+            seen += self.buckets[bucket]
+            if rank < seen:
+                value = self.__value(bucket)
+                return min(max(value, self.min), self.max)
+
+        return self.max
+
+    @staticmethod
+    def from_values(values, **kwargs):
+        sketch = QuantileSketch(**kwargs)
+        for v in values:
+            sketch.add(v)
+        return sketch
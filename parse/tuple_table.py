@@ -1,10 +1,21 @@
+import glob
+import numpy as np
+import os
+
 from Cheetah.Template import Template
 from collections import defaultdict,namedtuple
-from point import SummaryPoint,Type
-from dir_map import DirMap
+from point import SummaryPoint,Type,summarize_points
+from dir_map import DirMap,write_csv
 from col_map import ColMap,ColMapBuilder
 from pprint import pprint
 
+def read_rows(fname):
+    '''Return a map of the first value of each row in csv @fname to the
+    values of the row.'''
+    with open(fname) as f:
+        rows = [line.strip().split(",") for line in f if line.strip()]
+    return dict((row[0], row) for row in rows)
+
 class TupleTable(object):
     def __init__(self, col_map, default=lambda:[]):
         self.col_map = col_map
@@ -32,11 +43,23 @@ class TupleTable(object):
     def __iter__(self):
         return self.table.iteritems()
 
-    def reduce(self):
+    def reduce(self, bootstrap=None):
+        '''Summarize the points of each key, bootstrapping confidence
+        intervals if @bootstrap is a (resamples, seed) tuple.'''
         reduced = ReducedTupleTable(self.col_map)
+        keys = []
         for key, value in self.table.iteritems():
             if type(value) == type([]):
-                value = SummaryPoint(value[0].id, value)
+                keys += [key]
+            else:
+                reduced.table[key] = value
+
+        # Every key is summarized at once
+        groups = [self.table[key] for key in keys]
+        summary_maps = summarize_points(groups, bootstrap=bootstrap)
+        for key, points, summaries in zip(keys, groups, summary_maps):
+            value = SummaryPoint(points[0].id)
+            value.add_summaries(points, summaries, bootstrap=bootstrap)
             reduced.table[key] = value
         return reduced
 
@@ -51,47 +74,111 @@ class ReducedTupleTable(TupleTable):
     def __init__(self, col_map):
         super(ReducedTupleTable, self).__init__(col_map, default=SummaryPoint)
 
+    def __add_summary(self, dir_map, stat, variable, line, value, summary):
+        for summary_type in Type:
+            measurement = summary[summary_type]
+
+            for base_type in Type:
+                if not base_type in measurement:
+                    continue
+                # Ex: release/num_tasks/measured-max/avg/x=5.csv
+                leaf = line + ".csv"
+                path = [ stat, variable, base_type, summary_type, leaf ]
+                result = measurement[base_type]
+
+                dir_map.add_values(path, [(value, result)])
+
     def __add_to_dirmap(self, dir_map, variable, kv, point):
         value = kv.pop(variable)
+        line  = self.col_map.encode(kv)
 
         for stat in point.get_stats():
-            summary = point[stat]
-
-            for summary_type in Type:
-                measurement = summary[summary_type]
-
-                for base_type in Type:
-                    if not base_type in measurement:
-                        continue
-                    # Ex: release/num_tasks/measured-max/avg/x=5.csv
-                    leaf = (self.col_map.encode(kv) or "line") + ".csv"
-                    path = [ stat, variable, base_type, summary_type, leaf ]
-                    result = measurement[base_type]
+            self.__add_summary(dir_map, stat, variable, line or "line",
+                               value, point[stat])
 
-                    dir_map.add_values(path, [(value, result)])
+        # Each CPU is a line of its own, ex: CXS/x/Max/Avg/y=2_cpu=1.csv
+        for stat, by_cpu in point.get_cpu_stats().iteritems():
+            for cpu, summary in by_cpu.iteritems():
+                cpu_line = "_".join(filter(None, [line, "cpu=%d" % cpu]))
+                self.__add_summary(dir_map, stat, variable, cpu_line,
+                                   value, summary)
 
         kv[variable] = value
 
-    def to_dir_map(self):
+    def __numeric_columns(self, kv):
+        for col in self.col_map.columns():
+            try:
+                float(str(kv[col]))
+            except:
+                # Only vary numbers. Otherwise, just have seperate files
+                continue
+            yield col
+
+    def to_dir_map(self, prune=True):
+        '''Return a DirMap of csvs for every point. Unless @prune is False,
+        csvs with a single row are left out.'''
         dir_map = DirMap()
 
         for key, point in self.table.iteritems():
             kv = self.col_map.get_kv(key)
 
-            for col in self.col_map.columns():
-                val = kv[col]
-
-                try:
-                    float(str(val))
-                except:
-                    # Only vary numbers. Otherwise, just have seperate files
-                    continue
-
+            for col in self.__numeric_columns(kv):
                 self.__add_to_dirmap(dir_map, col, kv, point)
 
-        dir_map.remove_childless()
+        if prune:
+            dir_map.remove_childless()
         return dir_map
 
+    def update_dir(self, out_dir, hist_dir, keys):
+        '''Replace the rows written by to_dir_map into @out_dir and the
+        histograms written into @hist_dir for each of @keys with those of
+        this table, which leaves out any which have no points left. Rows of
+        other keys in this table are written again, the rest are left as
+        they are.'''
+        # Rows of each csv, by the value of their variable
+        csvs = defaultdict(dict)
+
+        for key in keys:
+            kv = self.col_map.get_kv(key)
+            line = self.col_map.encode(kv) or "line"
+            for hist in glob.glob("%s/*/%s.npy" % (hist_dir, line)):
+                os.remove(hist)
+
+            for col in self.__numeric_columns(kv):
+                value = kv.pop(col)
+                line  = self.col_map.encode(kv)
+                names = [line or "line",
+                         "_".join(filter(None, [line, "cpu=*"]))]
+                kv[col] = value
+
+                for name in names:
+                    pattern = "%s/*/%s/*/*/%s.csv" % (out_dir, col, name)
+                    for fname in glob.glob(pattern):
+                        if fname not in csvs:
+                            csvs[fname] = read_rows(fname)
+                        csvs[fname].pop(str(value), None)
+
+        for path, node in self.to_dir_map(prune=False).leafs():
+            if not node.values:
+                # An empty map
+                continue
+            fname = "/".join([out_dir] + path)
+            if fname not in csvs and os.path.exists(fname):
+                csvs[fname] = read_rows(fname)
+            for row in node.values:
+                csvs[fname][str(row[0])] = [str(v) for v in row]
+
+        for fname, rows in csvs.iteritems():
+            if len(rows) > 1:
+                if not os.path.exists(os.path.dirname(fname)):
+                    os.makedirs(os.path.dirname(fname))
+                write_csv(fname, rows.values())
+            elif os.path.exists(fname):
+                # Single values are not worth a csv
+                os.remove(fname)
+
+        self.write_histograms(hist_dir)
+
     @staticmethod
     def from_dir_map(dir_map):
         Leaf = namedtuple('Leaf', ['stat', 'variable', 'base',
@@ -135,19 +222,39 @@ class ReducedTupleTable(TupleTable):
 
         return table
 
+    def write_histograms(self, out_dir):
+        '''Save the histograms of each point in @out_dir, ex:
+        out_dir/CXS/tasks=10_util=2.npy.'''
+        for key, point in self.table.iteritems():
+            line = self.col_map.encode(self.col_map.get_kv(key)) or "line"
+
+            for stat, hist in point.get_histograms().iteritems():
+                stat_dir = "%s/%s" % (out_dir, stat)
+                if not os.path.exists(stat_dir):
+                    os.makedirs(stat_dir)
+                np.save("%s/%s.npy" % (stat_dir, line), hist)
+
     def write_map(self, out_map):
         rows = {}
 
+        def averages(measurement):
+            values = {}
+            for base_type in Type:
+                type_key = str(base_type).lower()
+                if base_type in measurement[Type.Avg]:
+                    values[type_key] = measurement[Type.Avg][base_type]
+            return values
+
         for key, point in self.table.iteritems():
             row = {}
             for name,measurement in point:
                 name = name.lower().replace('_','-')
-                row[name]={}
-                for base_type in Type:
-                    type_key = str(base_type).lower()
-                    if base_type in measurement[Type.Avg]:
-                        value = measurement[Type.Avg][base_type]
-                        row[name][type_key] = value
+                row[name] = averages(measurement)
+            for name, by_cpu in point.get_cpu_stats().iteritems():
+                name = name.lower().replace('_','-')
+                # Ex: row['cxs']['cpu'][1]['max']
+                row.setdefault(name, {})['cpu'] = \
+                    dict((cpu, averages(m)) for cpu, m in by_cpu.iteritems())
             rows[key] = row
 
         result = {'columns': self.col_map.columns(), 'rows':rows}
@@ -0,0 +1,89 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import time
+
+# Seconds between checks of directories without inotify
+POLL_INTERVAL = 10
+
+# Events of inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_ONLYDIR     = 0x01000000
+
+# Entries added to or removed from a directory
+DIR_EVENTS  = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+# Files written or moved into a directory
+FILE_EVENTS = IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR
+
+def load_inotify():
+    '''Return the C library if it supports inotify, otherwise None.'''
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+class DirWatcher(object):
+    '''Waits for events in directories using inotify. Where inotify is not
+    available, or runs out of watches, it wakes every @interval seconds
+    instead, so callers must check what changed themselves.'''
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.watches  = {}
+        self.fd = None
+
+        self.libc = load_inotify()
+        if self.libc:
+            fd = self.libc.inotify_init()
+            self.fd = fd if fd >= 0 else None
+
+    def polling(self):
+        return self.fd is None
+
+    def set_watches(self, watches):
+        '''Watch each directory in map @watches for the events in its mask,
+        and stop watching any others.'''
+        if self.polling():
+            return
+
+        for path in set(self.watches) - set(watches):
+            # Fails harmlessly if the directory is gone
+            self.libc.inotify_rm_watch(self.fd, self.watches.pop(path))
+
+        for path, mask in watches.iteritems():
+            wd = self.libc.inotify_add_watch(self.fd, path, mask)
+            if wd >= 0:
+                self.watches[path] = wd
+            elif ctypes.get_errno() != errno.ENOENT:
+                # Most likely out of watches. Directories removed since
+                # they were found are simply skipped
+                self.close()
+                return
+
+    def wait(self):
+        '''Return once an event arrives, or after the poll interval.'''
+        if self.polling():
+            time.sleep(self.interval)
+            return
+
+        try:
+            select.select([self.fd], [], [])
+            # Only whether something happened matters, not what
+            while select.select([self.fd], [], [], 0)[0]:
+                os.read(self.fd, 1 << 16)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.watches = {}
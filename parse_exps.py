@@ -3,18 +3,25 @@ from __future__ import print_function
 
 import common as com
 import multiprocessing
+import multiprocessing.pool
 import os
+import parse.cache as cache
 import parse.ft as ft
+import parse.histogram as histogram
 import parse.sched as st
+import parse.watch as watch
 import pickle
+import re
 import shutil as sh
 import sys
+import time
 import traceback
 
-from collections import namedtuple
+from collections import defaultdict,namedtuple
 from config.config import FILES,DEFAULTS,PARAMS
 from optparse import OptionParser
 from parse.point import ExpPoint
+from parse.point_store import PointStore
 from parse.tuple_table import TupleTable
 from parse.col_map import ColMapBuilder
 
@@ -42,55 +49,160 @@ def parse_args():
                       action='store_true', default=False,
                       help=('simplify graphs where possible by averaging ' +
                             'parameter values which are numbers (dangerous)'))
+    parser.add_option('-w', '--window', dest='window', metavar='HEAD,TAIL',
+                      default=None,
+                      help=('ignore scheduling records in the first HEAD ms ' +
+                            'after the synchronous release and the last ' +
+                            'TAIL ms of each experiment'))
+    parser.add_option('-s', '--st-show', dest='st_show', action='store_true',
+                      default=False,
+                      help='save a text version of sched-trace data using ' +
+                           'st_show, which is slow')
+    parser.add_option('-u', '--unsorted-ft', dest='sort_ft',
+                      action='store_false', default=True,
+                      help='never sort large overhead traces on disk, ' +
+                           'which pairs all events of an overhead in memory')
+    parser.add_option('-O', '--outliers', dest='outliers',
+                      metavar='FILTER[,ARG]', default=None,
+                      help=('leave outliers out of overheads, where FILTER ' +
+                            'is iqr (ARG interquartile ranges outside the ' +
+                            'quartiles, 1.5 by default), cycles (longer ' +
+                            'than ARG cycles) or top (the ARG largest)'))
+    parser.add_option('-H', '--histograms', dest='histograms',
+                      metavar='KIND[,ARG]', default=None,
+                      help=('save histograms of overheads for CDF plots, ' +
+                            'where KIND is linear (bins ARG us wide, .1 by ' +
+                            'default) or log (ARG bins to each power of ten, ' +
+                            '20 by default)'))
+    parser.add_option('-C', '--cache-dir', dest='cache_dir',
+                      default=DEFAULTS['parse-cache'],
+                      help=('directory of parsed experiments shared by all ' +
+                            'outputs, reused while their trace files, ' +
+                            'params and parse options are unchanged'))
+    parser.add_option('-b', '--bootstrap', dest='bootstrap',
+                      metavar='RESAMPLES[,SEED]', default=None,
+                      help=('add confidence intervals of averages across ' +
+                            'trials, from RESAMPLES bootstrap resamples of ' +
+                            'the trials drawn with random SEED (0 by default)'))
+    parser.add_option('-I', '--incremental', dest='incremental',
+                      action='store_true', default=False,
+                      help=('parse only experiments which are new or changed ' +
+                            'since the csvs in the output directory were ' +
+                            'written, and rewrite only their rows'))
+    parser.add_option('-W', '--watch', dest='watch', action='store_true',
+                      default=False,
+                      help=('parse experiments as they are finished in the ' +
+                            'given data directories, %s by default, ' +
+                            'updating csvs incrementally until interrupted')
+                            % DEFAULTS['out-run'])
 
     return parser.parse_args()
 
 
-ExpData = namedtuple('ExpData', ['path', 'params', 'work_dir'])
+# Inputs is a map of the files an experiment is parsed from to their
+# sizes and modification times
+ExpData = namedtuple('ExpData', ['path', 'params', 'work_dir', 'inputs'])
 
+# Version of parsed experiments in the cache. Increment this whenever
+# parsing changes, so points parsed before are not reused
+PARSE_VERSION = 4
 
-def parse_exp(exp_force):
-    # Tupled for multiprocessing
-    exp, force = exp_force
 
-    result_file = exp.work_dir + "/exp_point.pkl"
-    should_load = not force and os.path.exists(result_file)
+def get_inputs(data_dir):
+    '''Return a map of each file in @data_dir an experiment is parsed from
+    to its size and modification time.'''
+    inputs = r"(%s)|(%s)|(%s)" % (re.escape(FILES['params_file']),
+                                  FILES['ft_matches'],
+                                  FILES['sched_data'].format(".*"))
+    stats  = {}
+    for name in os.listdir(data_dir):
+        path = "%s/%s" % (data_dir, name)
+        if re.match(inputs + "$", name) and os.path.isfile(path):
+            stat = os.stat(path)
+            stats[name] = (stat.st_size, stat.st_mtime)
+    return stats
 
-    result = None
-    if should_load:
-        with open(result_file, 'rb') as f:
-            try:
-                # No need to go through this work twice
-                result = pickle.load(f)
-            except:
-                pass
 
-    if not result:
-        try:
-            # Create a readable name
-            name = os.path.relpath(exp.path)
-            name = name if name != "." else os.path.split(os.getcwd())[1]
+def get_cache_key(exp, hashes, opts):
+    '''Return the key of @exp in the cache, from the @hashes of every file
+    it is parsed from and the options which change how it is parsed.'''
+    settings = (PARSE_VERSION, exp.params[PARAMS['cycles']], opts.window,
+                opts.outliers, opts.histograms)
+    return cache.point_key(hashes, settings)
+
+
+def get_exp_name(exp):
+    '''Return a readable name for @exp.'''
+    name = os.path.relpath(exp.path)
+    return name if name != "." else os.path.split(os.getcwd())[1]
+
+
+def parse_exp(exp_opts):
+    # Tupled for multiprocessing
+    exp, opts = exp_opts
+    begin = time.time()
+
+    store = None
+    try:
+        # Inputs may be unreadable or gone by now
+        hashes = cache.input_hashes(exp.path, exp.work_dir, exp.inputs.keys())
+        key    = get_cache_key(exp, hashes, opts)
+        store  = PointStore(opts.cache_dir)
 
-            result = ExpPoint(name)
+        # No need to go through this work twice, even for a copy of exp
+        if opts.force or key not in store:
+            result = ExpPoint(get_exp_name(exp))
+            times  = []
 
             # Write overheads into result
+            start  = time.time()
             cycles = exp.params[PARAMS['cycles']]
-            ft.extract_ft_data(result, exp.path, exp.work_dir, cycles)
+            ft.extract_ft_data(result, exp.path, exp.work_dir, cycles,
+                               opts.sort_ft, opts.outliers, opts.histograms,
+                               hashes)
+            times += [('overheads', time.time() - start)]
 
             # Write scheduling statistics into result
-            st.extract_sched_data(result, exp.path, exp.work_dir)
+            start = time.time()
+            st.extract_sched_data(result, exp.path, exp.work_dir,
+                                  opts.window, opts.st_processors,
+                                  opts.st_show)
+            times += [('scheduling', time.time() - start)]
+
+            store.save(key, exp.path, exp.params, result)
+
+            # Seconds spent in each stage, for finding slow stages
+            with open(exp.work_dir + "/parse-times", 'w') as f:
+                for stage, secs in times:
+                    f.write("%s: %.3f\n" % (stage, secs))
+        elif opts.st_show:
+            # The text dump is not part of the stored point
+            st.show_sched_data(exp.path, exp.work_dir)
+    except:
+        traceback.print_exc()
+        key = None
+    finally:
+        if store:
+            store.close()
+
+    # The result is read from the store, rather than sent back through a pipe
+    return (exp, key, (os.getpid(), time.time() - begin))
 
-            with open(result_file, 'wb') as f:
-                pickle.dump(result, f)
-        except:
-            traceback.print_exc()
 
-    return (exp, result)
+def get_cost(exp):
+    '''Estimate how long @exp takes to parse from the sizes of its inputs.'''
+    return sum(size for size, _ in exp.inputs.itervalues())
 
 
-def get_exp_params(data_dir, cm_builder):
+def get_exp_params(data_dir, cm_builder, known=None):
+    '''Return the params of the experiment in @data_dir, or @known params
+    read from its params file before.'''
     param_file = "%s/%s" % (data_dir, FILES['params_file'])
-    if os.path.isfile(param_file):
+    if known is not None:
+        params = dict(known)
+        for key, value in params.iteritems():
+            cm_builder.try_add(key, value)
+    elif os.path.isfile(param_file):
         params = com.load_params(param_file)
 
         # Store parameters in cm_builder, which will track which parameters change
@@ -107,7 +219,23 @@ def get_exp_params(data_dir, cm_builder):
     return params
 
 
-def load_exps(exp_dirs, cm_builder, force):
+def clear_work_dir(work_dir):
+    '''Remove everything in @work_dir but decoded traces, which are checked
+    against their sources before they are used.'''
+    for name in os.listdir(work_dir):
+        path = "%s/%s" % (work_dir, name)
+        if name == FILES['decode_cache']:
+            continue
+        elif os.path.isdir(path):
+            sh.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def load_exps(exp_dirs, cm_builder, force, manifest={}):
+    '''Return an ExpData for each of @exp_dirs. The params of experiments
+    which have not changed since @manifest was written are not read
+    again.'''
     exps = []
 
     sys.stderr.write("Loading experiments...\n")
@@ -120,13 +248,19 @@ def load_exps(exp_dirs, cm_builder, force):
         work_dir = data_dir + "/tmp"
 
         if os.path.exists(work_dir) and force:
-            sh.rmtree(work_dir)
+            clear_work_dir(work_dir)
         if not os.path.exists(work_dir):
             os.mkdir(work_dir)
 
-        params = get_exp_params(data_dir, cm_builder)
+        inputs = get_inputs(data_dir)
+        entry  = manifest.get(os.path.abspath(data_dir))
+        known  = None
+        if entry and entry['inputs'] == inputs:
+            known = entry['params']
+
+        params = get_exp_params(data_dir, cm_builder, known)
 
-        exps += [ ExpData(data_dir, params, work_dir) ]
+        exps += [ ExpData(data_dir, params, work_dir, inputs) ]
 
     return exps
 
@@ -143,30 +277,55 @@ def get_dirs(args):
         return [os.getcwd()]
 
 
-def fill_table(table, exps, opts):
+class NonDaemonProcess(multiprocessing.Process):
+    '''A process which may start processes of its own.'''
+    def _get_daemon(self):
+        return False
+    def _set_daemon(self, value):
+        pass
+    daemon = property(_get_daemon, _set_daemon)
+
+class NestedPool(multiprocessing.pool.Pool):
+    '''A pool whose workers may use pools of their own.'''
+    Process = NonDaemonProcess
+
+
+def parse_all(exps, opts):
+    '''Parse @exps into the store, returning a map of the path of each to
+    its key in the store, or None if it could not be parsed.'''
+    if not exps:
+        return {}
+
     sys.stderr.write("Parsing data...\n")
 
-    procs  = min(len(exps), opts.processors)
-    logged = multiprocessing.Manager().list()
+    procs = min(len(exps), opts.processors)
+    log   = com.LogQueue()
 
-    pool = multiprocessing.Pool(processes=procs,
-    # Share a list of previously logged messages amongst processes
-    # This is for the com.log_once method to use
-                initializer=com.set_logged_list, initargs=(logged,))
+    # Processors left over when there are fewer experiments than processors
+    # decode the sched-trace files of each experiment in parallel
+    opts.st_processors = max(opts.processors / procs, 1)
+    pool_class = NestedPool if opts.st_processors > 1 else multiprocessing.Pool
 
-    pool_args = zip(exps, [opts.force]*len(exps))
+    # Workers send messages from com.log_once to be written here once
+    pool = pool_class(processes=procs,
+                initializer=com.set_log_queue, initargs=(log.queue,))
+
+    # Largest first, so the last experiments to finish are short ones
+    # rather than a large trace parsed while other processors sit idle
+    ordered = sorted(exps, key=get_cost, reverse=True)
+    pool_args = zip(ordered, [opts]*len(exps))
     enum = pool.imap_unordered(parse_exp, pool_args, 1)
 
+    keys  = {}
+    busy  = defaultdict(lambda: [0, 0.0])
+    start = time.time()
     try:
-        for i, (exp, result) in enumerate(enum):
-            if not result:
-                continue
-
-            if opts.verbose:
-                print(result)
-            else:
+        for i, (exp, key, (pid, secs)) in enumerate(enum):
+            keys[exp.path] = key
+            busy[pid][0] += 1
+            busy[pid][1] += secs
+            if not opts.verbose:
                 sys.stderr.write('\r {0:.2%}'.format(float(i)/len(exps)))
-                table[exp.params] += [result]
 
         pool.close()
     except:
@@ -175,12 +334,159 @@ def fill_table(table, exps, opts):
         raise Exception("Failed parsing!")
     finally:
         pool.join()
+        log.close()
 
     sys.stderr.write('\n')
+    report_workers(busy, procs, time.time() - start)
+    return keys
+
+
+def report_workers(busy, procs, elapsed):
+    '''Write how many experiments each of @procs workers parsed and how
+    long it was busy, from a map of their pids to these in @busy, out of
+    the @elapsed seconds parsing took.'''
+    total = sum(secs for _, secs in busy.itervalues())
+    sys.stderr.write("Workers were busy %.0f%% of %.1f seconds:\n" %
+                     (100 * total / max(procs * elapsed, 1e-9), elapsed))
+
+    # Workers which parsed nothing were never busy
+    stats = sorted(busy.values(), key=lambda s: -s[1])
+    stats += [[0, 0.0]] * (procs - len(stats))
+    for i, (count, secs) in enumerate(stats):
+        sys.stderr.write("  worker %d: %d experiments, busy %.1f seconds " %
+                         (i + 1, count, secs) +
+                         "(%.0f%%)\n" % (100 * secs / max(elapsed, 1e-9)))
+
+
+def add_points(table, exps, keys, opts):
+    '''Add the point of each of @exps, stored under its path in @keys, to
+    @table.'''
+    store  = PointStore(opts.cache_dir)
+    points = dict(store.load(keys[e.path] for e in exps if keys[e.path]))
+    store.close()
+
+    # Trials are added in the order given, whatever order they finish in,
+    # so their summaries are always the same
+    for exp in exps:
+        result = points.get(keys[exp.path])
+        if result is None:
+            # Never leave out a trial unnoticed
+            reason = "could not be parsed" if not keys[exp.path] else \
+                     "is missing from %s" % opts.cache_dir
+            sys.stderr.write("Leaving out %s, which %s\n" %
+                             (get_exp_name(exp), reason))
+            continue
+        elif not result:
+            # No overheads or scheduling data were found
+            continue
+
+        # Points are shared by copies of an experiment
+        result.id = get_exp_name(exp)
+        ft.save_histograms(result, exp.work_dir)
+
+        if opts.verbose:
+            print(result)
+        else:
+            table[exp.params] += [result]
+
+
+def fill_table(table, exps, opts):
+    keys = parse_all(exps, opts)
+    add_points(table, exps, keys, opts)
+    return keys
+
+
+def get_settings(opts):
+    '''Return the options besides experiments which change the csvs.'''
+    return (PARSE_VERSION, opts.window, opts.outliers, opts.histograms,
+            opts.bootstrap, opts.ignore)
 
 
-def write_csvs(table, out, print_empty=False):
-    reduced_table = table.reduce()
+def read_manifest(out_dir):
+    '''Return the manifest of the csvs in @out_dir, or None.'''
+    try:
+        with open("%s/%s" % (out_dir, FILES['parse_manifest']), 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+
+def write_manifest(out_dir, exps, keys, col_map, opts):
+    '''Record what the csvs in @out_dir were written from: the params,
+    inputs and key in the store of each of @exps, by their absolute
+    paths, and the columns and options they were written with.'''
+    manifest = {'settings' : get_settings(opts),
+                'columns'  : col_map.columns(),
+                'exps'     : {}}
+    for exp in exps:
+        manifest['exps'][os.path.abspath(exp.path)] = \
+            {'params' : exp.params, 'inputs' : exp.inputs,
+             'key'    : keys.get(exp.path)}
+
+    with open("%s/%s" % (out_dir, FILES['parse_manifest']), 'wb') as f:
+        pickle.dump(manifest, f, pickle.HIGHEST_PROTOCOL)
+
+
+def get_lines(col_map, params):
+    '''Return the lines of csvs which a point with @params is in: each
+    column, with the values of the others.'''
+    key = col_map.get_key(params)
+    return set((i, key[:i] + key[i+1:]) for i in range(len(key)))
+
+
+def update_csvs(table, exps, manifest, opts):
+    '''Parse only those of @exps which are new or changed since the csvs
+    in opts.out were written from the experiments in @manifest, then
+    rewrite only the rows of csvs with new, changed or removed trials.
+    Return the keys of @exps in the store.'''
+    col_map = table.get_col_map()
+    known   = manifest['exps']
+    paths   = dict((os.path.abspath(exp.path), exp) for exp in exps)
+
+    # Points missing from the store, e.g. as it was cleared or another
+    # cache directory is used, are parsed again like changed experiments
+    store = PointStore(opts.cache_dir)
+    keys, changed = {}, []
+    for path, exp in paths.iteritems():
+        entry = known.get(path)
+        if entry and entry['key'] and entry['inputs'] == exp.inputs and \
+           entry['key'] in store:
+            keys[exp.path] = entry['key']
+        else:
+            changed += [exp]
+    store.close()
+    removed = [path for path in known if path not in paths]
+
+    if not (changed or removed):
+        sys.stderr.write("No experiments changed.\n")
+        return keys
+
+    keys.update(parse_all(changed, opts))
+
+    # Parameters whose trials changed, as they were and as they are now
+    stale = set(col_map.get_key(exp.params) for exp in changed)
+    for path in removed + [os.path.abspath(exp.path) for exp in changed]:
+        if path in known:
+            stale.add(col_map.get_key(known[path]['params']))
+
+    # Every row of their lines is written again, as csvs with a single
+    # row were never written
+    lines = set()
+    for key in stale:
+        lines |= get_lines(col_map, col_map.get_kv(key))
+    add_points(table, [exp for exp in exps
+                       if get_lines(col_map, exp.params) & lines], keys, opts)
+
+    sys.stderr.write("Updating csvs in %s for %d experiments...\n" %
+                     (opts.out, len(changed) + len(removed)))
+    reduced_table = table.reduce(opts.bootstrap)
+    reduced_table.update_dir(opts.out,
+                             "%s/%s" % (opts.out, FILES['histograms']), stale)
+    return keys
+
+
+def write_csvs(table, out, print_empty=False, bootstrap=None):
+    reduced_table = table.reduce(bootstrap)
 
     # Write out csv directories for all variable params
     dir_map = reduced_table.to_dir_map()
@@ -196,6 +502,9 @@ def write_csvs(table, out, print_empty=False):
     else:
         dir_map.write(out)
 
+    # CDFs can be plotted even if no parameter varies
+    reduced_table.write_histograms("%s/%s" % (out, FILES['histograms']))
+
 
 def write_collapsed_csvs(table, opts):
     sys.stderr.write("Collapse option specified. "
@@ -233,7 +542,7 @@ def write_collapsed_csvs(table, opts):
             kv = original_map.get_kv(mapped_key)
             next_table[kv] += points
 
-        write_csvs(next_table, opts.out)
+        write_csvs(next_table, opts.out, bootstrap=opts.bootstrap)
 
         builder.try_remove(num_column)
 
@@ -241,7 +550,7 @@ def write_collapsed_csvs(table, opts):
 def write_output(table, opts):
     if opts.write_map:
         sys.stderr.write("Writing python map into %s...\n" % opts.out)
-        reduced_table = table.reduce()
+        reduced_table = table.reduce(opts.bootstrap)
         reduced_table.write_map(opts.out)
     else:
         if opts.force and os.path.exists(opts.out):
@@ -252,16 +561,21 @@ def write_output(table, opts):
         if opts.collapse:
             write_collapsed_csvs(table, opts)
         else:
-            write_csvs(table, opts.out, not opts.verbose)
+            write_csvs(table, opts.out, not opts.verbose, opts.bootstrap)
 
 
-def main():
-    opts, args = parse_args()
-    exp_dirs = get_dirs(args)
+def parse_dirs(exp_dirs, opts):
+    '''Write output for the experiments in @exp_dirs, updating the csvs
+    written before if opts.incremental. Return False if there was no data
+    to write.'''
+    manifest = None
+    if opts.incremental and not opts.force:
+        manifest = read_manifest(opts.out)
 
     # Load experiment parameters into a ColMap
     builder = ColMapBuilder()
-    exps = load_exps(exp_dirs, builder, opts.force)
+    exps = load_exps(exp_dirs, builder, opts.force,
+                     manifest['exps'] if manifest else {})
 
     # Don't track changes in ignored parameters
     if opts.ignore:
@@ -276,13 +590,158 @@ def main():
     col_map = builder.build()
     table = TupleTable(col_map)
 
-    fill_table(table, exps, opts)
+    if manifest and manifest['settings'] == get_settings(opts) and \
+       manifest['columns'] == col_map.columns():
+        keys = update_csvs(table, exps, manifest, opts)
+    else:
+        # Everything must be written again, as lines have changed
+        keys = fill_table(table, exps, opts)
+
+        if not table:
+            return False
+
+        if manifest:
+            # Csvs of lines which are gone would be left behind
+            sh.rmtree(opts.out)
+
+        write_output(table, opts)
+
+    manifest_file = "%s/%s" % (opts.out, FILES['parse_manifest'])
+    if opts.collapse and os.path.exists(manifest_file):
+        # Csvs of collapsed tables can't be updated
+        os.remove(manifest_file)
+    elif os.path.isdir(opts.out) and not (opts.write_map or opts.collapse):
+        write_manifest(opts.out, exps, keys, col_map, opts)
 
-    if not table:
+    return True
+
+
+def find_exps(data_dirs):
+    '''Return a map of the experiments in @data_dirs which are finished to
+    the sizes and modification times of their params files, and a list of
+    the others. Params are saved last by run_exps.py.'''
+    finished, unfinished = {}, []
+    for data_dir in data_dirs:
+        for name in os.listdir(data_dir):
+            path = "%s/%s" % (data_dir, name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                stat = os.stat("%s/%s" % (path, FILES['params_file']))
+            except OSError:
+                stat = None
+
+            # Params are created empty, then written
+            if stat and stat.st_size:
+                finished[path] = (stat.st_size, stat.st_mtime)
+            else:
+                unfinished += [path]
+    return finished, unfinished
+
+
+def watch_dirs(data_dirs, opts):
+    '''Parse experiments as they are finished in @data_dirs, updating the
+    csvs in opts.out, until interrupted.'''
+    watcher = watch.DirWatcher()
+    parsed  = None
+    # Experiments found when an update last failed
+    failed  = None
+    polling = False
+
+    try:
+        while True:
+            # New experiments appear in data_dirs, then save their params.
+            # After a failed update, finished ones are watched too, so that
+            # fixing any of them triggers another
+            finished, unfinished = find_exps(data_dirs)
+            watches = dict((d, watch.DIR_EVENTS) for d in data_dirs)
+            watches.update((d, watch.FILE_EVENTS) for d in unfinished +
+                           (finished.keys() if failed else []))
+            watcher.set_watches(watches)
+
+            if watcher.polling() and not polling:
+                sys.stderr.write("Cannot use inotify, checking for " +
+                                 "experiments every %d seconds.\n" %
+                                 watcher.interval)
+                polling = True
+
+            # Found after watches are set, so none finish unnoticed
+            finished, _ = find_exps(data_dirs)
+            if finished not in (parsed, failed):
+                try:
+                    if finished and not parse_dirs(sorted(finished), opts):
+                        sys.stderr.write("Found no data to parse!\n")
+                    parsed, failed = finished, None
+                except Exception:
+                    # E.g. params read while run_exps.py was writing them,
+                    # or a broken experiment
+                    traceback.print_exc()
+                    sys.stderr.write("Failed to update csvs, retrying " +
+                                     "once experiments change.\n")
+                    failed = finished
+                # Parsed experiments are only parsed again if they change
+                opts.force = False
+
+                sys.stderr.write("Watching %s for experiments...\n" %
+                                 ", ".join(data_dirs))
+                if failed:
+                    # Watch finished experiments before waiting
+                    continue
+
+            watcher.wait()
+    except KeyboardInterrupt:
+        sys.stderr.write("Stopped watching.\n")
+    finally:
+        watcher.close()
+
+
+def main():
+    opts, args = parse_args()
+
+    if opts.window:
+        opts.window = tuple(float(ms) for ms in opts.window.split(","))
+        if len(opts.window) != 2:
+            raise ValueError("Window must be given as HEAD,TAIL")
+
+    if opts.outliers:
+        method, _, arg = opts.outliers.partition(",")
+        if method not in ft.OUTLIER_FILTERS:
+            raise ValueError("Outlier filter must be one of: %s" %
+                             ", ".join(sorted(ft.OUTLIER_FILTERS)))
+        arg = float(arg) if arg else ft.OUTLIER_FILTERS[method]
+        if arg is None:
+            raise ValueError("Outlier filter '%s' needs an ARG" % method)
+        opts.outliers = (method, arg)
+
+    if opts.histograms:
+        kind, _, arg = opts.histograms.partition(",")
+        if kind not in histogram.KINDS:
+            raise ValueError("Histogram kind must be one of: %s" %
+                             ", ".join(sorted(histogram.KINDS)))
+        opts.histograms = (kind, float(arg) if arg else histogram.KINDS[kind])
+
+    if opts.bootstrap:
+        resamples, _, seed = opts.bootstrap.partition(",")
+        opts.bootstrap = (int(resamples), int(seed) if seed else 0)
+        if opts.bootstrap[0] < 1:
+            raise ValueError("Bootstrap needs at least one resample")
+
+    # Output is kept up to date as experiments finish
+    opts.incremental |= opts.watch
+
+    if opts.incremental and (opts.write_map or opts.collapse or opts.verbose):
+        raise ValueError("Only csvs can be updated incrementally")
+
+    if opts.watch:
+        data_dirs = args or [DEFAULTS['out-run']]
+        for data_dir in data_dirs:
+            if not os.path.isdir(data_dir):
+                raise IOError("Invalid data directory '%s'" %
+                              os.path.abspath(data_dir))
+        watch_dirs(data_dirs, opts)
+    elif not parse_dirs(get_dirs(args), opts):
         sys.stderr.write("Found no data to parse!")
         sys.exit(1)
 
-    write_output(table, opts)
-
 if __name__ == '__main__':
     main()
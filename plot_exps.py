@@ -12,13 +12,15 @@ import matplotlib.pyplot as plot
 
 import common as com
 import multiprocessing
+import numpy as np
 import os
+import parse.histogram as histogram
 import shutil as sh
 import sys
 import traceback
 
 from collections import namedtuple
-from config.config import DEFAULTS
+from config.config import DEFAULTS,FILES
 
 from optparse import OptionParser
 from parse.col_map import ColMap,ColMapBuilder
@@ -42,6 +44,7 @@ def parse_args():
 
 ExpDetails = namedtuple('ExpDetails', ['variable', 'value', 'title',
                                        'out', 'node'])
+CdfDetails = namedtuple('CdfDetails', ['value', 'title', 'out', 'lines'])
 OUT_FORMAT = 'pdf'
 
 def get_details(node, path, out_dir):
@@ -58,15 +61,15 @@ def get_details(node, path, out_dir):
 
     return ExpDetails(variable, value, title, out, node)
 
-def plot_by_variable(details):
-    '''Plot each .csv files under @plot_node as a line on a shared plot.'''
-
+def decode_lines(lines):
+    '''Decode the file name of each line in a map of names to @lines into a
+    configuration dict. Return a list of configurations and lines, and a
+    style map for the configurations.'''
     builder = ColMapBuilder()
-    config_nodes = []
+    config_lines = []
 
-    # Decode file names into configuration dicts
-    for line_path, line_node in details.node.children.iteritems():
-        encoded = line_path[:line_path.index(".csv")]
+    for line_path, line in lines.iteritems():
+        encoded = line_path[:line_path.rindex(".")]
 
         try:
             line_config = ColMap.decode(encoded)
@@ -75,10 +78,19 @@ def plot_by_variable(details):
 
         for k, v in line_config.iteritems():
             builder.try_add(k, v)
-        config_nodes += [(line_config, line_node)]
+        config_lines += [(line_config, line)]
+
+    return config_lines, make_styler(builder.build())
+
+def add_legend(axes, style_map):
+    lines, labels = zip(*style_map.get_key())
+    axes.legend(tuple(lines), tuple(labels), prop={'size':10},
+	    # This code places the legend slightly to the right of the plot
+        bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.0)
 
-    col_map   = builder.build()
-    style_map = make_styler(col_map)
+def plot_by_variable(details):
+    '''Plot each .csv files under @plot_node as a line on a shared plot.'''
+    config_nodes, style_map = decode_lines(details.node.children)
 
     figure = plot.figure()
     axes   = figure.add_subplot(111)
@@ -92,11 +104,7 @@ def plot_by_variable(details):
         plot.plot(xvalues, yvalues, style.fmt())
 
     axes.set_title(details.title)
-
-    lines, labels = zip(*style_map.get_key())
-    axes.legend(tuple(lines), tuple(labels), prop={'size':10},
-	    # This code places the legend slightly to the right of the plot
-        bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.0)
+    add_legend(axes, style_map)
 
     axes.set_ylabel(details.value)
     axes.set_xlabel(details.variable)
@@ -110,10 +118,59 @@ def plot_by_variable(details):
 
     return True
 
+def plot_cdf(details):
+    '''Plot the CDF of each histogram in @details.lines on a shared plot.'''
+    config_files, style_map = decode_lines(details.lines)
+
+    figure = plot.figure()
+    axes   = figure.add_subplot(111)
+
+    for line_config, hist_file in config_files:
+        style  = style_map.get_style(line_config)
+        xvalues, yvalues = histogram.cdf(np.load(hist_file))
+
+        plot.step(xvalues, yvalues, style.fmt(), where='post')
+
+    axes.set_title(details.title)
+    add_legend(axes, style_map)
+
+    axes.set_ylabel("Fraction of samples")
+    axes.set_xlabel(details.value)
+    axes.set_xlim(0, axes.get_xlim()[1])
+    axes.set_ylim(0, 1)
+
+    plot.savefig(details.out, format=OUT_FORMAT, bbox_inches='tight')
+
+    return True
+
+def get_cdf_details(data_dir, out_dir):
+    '''Return details of a CDF plot for each overhead with histograms saved
+    in @data_dir.'''
+    hist_dir = "%s/%s" % (data_dir, FILES['histograms'])
+    if not os.path.isdir(hist_dir):
+        return []
+
+    details = []
+    for value in sorted(os.listdir(hist_dir)):
+        value_dir = "%s/%s" % (hist_dir, value)
+        lines = dict((f, "%s/%s" % (value_dir, f))
+                     for f in os.listdir(value_dir) if f.endswith(".npy"))
+        if not lines:
+            continue
+
+        out   = "%s/%s_cdf.%s" % (out_dir, value, OUT_FORMAT)
+        title = "%s CDF" % value.capitalize()
+        details += [CdfDetails(value, title, out, lines)]
+
+    return details
+
 def plot_wrapper(details):
     '''Wrap exceptions in named method for printing in multiprocessing pool.'''
     try:
-        return plot_by_variable(details)
+        if isinstance(details, CdfDetails):
+            return plot_cdf(details)
+        else:
+            return plot_by_variable(details)
     except:
         traceback.print_exc()
 
@@ -126,24 +183,32 @@ def plot_dir(data_dir, out_dir, max_procs, force):
 
     sys.stderr.write("Plotting...\n")
 
+    cdf_details = get_cdf_details(data_dir, out_dir)
+    # There may only be histograms if no parameters varied
+    leafs = [] if dir_map.is_empty() else list(dir_map.leafs(1))
+
     # Count total plots for % counter
-    num_plots = len([x for x in dir_map.leafs(1)])
+    num_plots = len(leafs) + len(cdf_details)
 
     plot_details = []
-    for plot_path, plot_node in dir_map.leafs(1):
+    for plot_path, plot_node in leafs:
         details = get_details(plot_node, plot_path, out_dir)
 
         if force or not os.path.exists(details.out):
             plot_details += [details]
 
+    for details in cdf_details:
+        if force or not os.path.exists(details.out):
+            plot_details += [details]
+
     if not plot_details:
         return
 
-    procs  = min(len(plot_details), max_procs)
-    logged = multiprocessing.Manager().list()
+    procs = min(len(plot_details), max_procs)
+    log   = com.LogQueue()
 
-    pool   = multiprocessing.Pool(processes=procs,
-                initializer=com.set_logged_list, initargs=(logged,))
+    pool  = multiprocessing.Pool(processes=procs,
+                initializer=com.set_log_queue, initargs=(log.queue,))
 
     enum  = pool.imap_unordered(plot_wrapper, plot_details)
 
@@ -157,6 +222,7 @@ def plot_dir(data_dir, out_dir, max_procs, force):
         raise Exception("Failed plotting!")
     finally:
         pool.join()
+        log.close()
 
     sys.stderr.write('\n')
 